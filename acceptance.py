@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from db import db  # Ensure this imports your configured PyMongo instance
+from submissions import set_submission_status
+from task_feed import mark_feed_completed
+from wallet import credit_wallet_for_task, WalletNotFound
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# "auto" uses a transaction when connected to a replica set or sharded cluster,
+# "1" always does, "0" always uses the outbox marker.
+ACCEPTANCE_TRANSACTIONS = os.getenv("ACCEPTANCE_TRANSACTIONS", "auto")
+ACCEPTANCE_RECOVERY_INTERVAL = float(os.getenv("ACCEPTANCE_RECOVERY_INTERVAL", "60"))
+# An acceptance still marked pending after this long is assumed interrupted and finished by the sweeper.
+ACCEPTANCE_RECOVERY_AGE_SECONDS = float(os.getenv("ACCEPTANCE_RECOVERY_AGE_SECONDS", "120"))
+
+# Without transactions, the task_history record is the outbox: it is inserted with
+#   pending_credit: {at, verification_details}
+# and the marker is removed once the wallet, ledger, submission and feed writes
+# are done. Every one of those writes is idempotent, so a crashed acceptance is
+# completed by re-running them.
+
+
+class AlreadyAccepted(Exception):
+    """Raised when the user's submission for the task has already been accepted."""
+
+
+def ensure_acceptance_indexes():
+    try:
+        db.task_history.create_index([("taskId", 1), ("userId", 1)], unique=True)
+    except Exception as e:
+        # Legacy duplicates prevent the unique index; the wallet credit guard still applies.
+        logger.error("Error creating unique task_history index: %s", e)
+    try:
+        db.task_history.create_index("pending_credit.at", sparse=True)
+    except Exception as e:
+        logger.error("Error creating pending acceptance index: %s", e)
+
+
+def credit_id_for(task_id, user_id):
+    return f"task:{task_id}:{user_id}"
+
+
+def _use_transactions():
+    if ACCEPTANCE_TRANSACTIONS in ("0", "1"):
+        return ACCEPTANCE_TRANSACTIONS == "1"
+    return db.client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+def _apply(history_doc, verification_details, session=None):
+    """The writes that follow an accepted history record."""
+    task_id, user_id = history_doc["taskId"], history_doc["userId"]
+    credit_wallet_for_task(
+        user_id, task_id, history_doc.get("task_price", 0), credit_id_for(task_id, user_id), session=session
+    )
+    set_submission_status(task_id, user_id, "accepted", verification_details, session=session)
+    mark_feed_completed(user_id, task_id, session=session)
+
+
+def _commit_in_transaction(history_doc, verification_details):
+    def callback(session):
+        db.task_history.insert_one(history_doc, session=session)
+        _apply(history_doc, verification_details, session=session)
+
+    try:
+        with db.client.start_session() as session:
+            session.with_transaction(callback)
+    except DuplicateKeyError:
+        raise AlreadyAccepted()
+
+
+def _commit_with_outbox(history_doc, verification_details):
+    record = dict(history_doc, pending_credit={
+        "at": datetime.utcnow(),
+        "verification_details": verification_details
+    })
+    try:
+        db.task_history.insert_one(record)
+    except DuplicateKeyError:
+        # A concurrent or earlier submission owns this acceptance; the sweeper finishes it if interrupted.
+        raise AlreadyAccepted()
+    try:
+        _apply(history_doc, verification_details)
+    except WalletNotFound:
+        db.task_history.delete_one({"_id": record["_id"]})
+        raise
+    db.task_history.update_one({"_id": record["_id"]}, {"$unset": {"pending_credit": ""}})
+
+
+def commit_acceptance(history_doc, verification_details=None):
+    """
+    Record an accepted submission as one unit: the task_history record, the
+    wallet credit and ledger entry, the submission status and the feed entry.
+    Raises AlreadyAccepted for a duplicate and WalletNotFound if the user has no wallet.
+    """
+    if _use_transactions():
+        _commit_in_transaction(history_doc, verification_details)
+    else:
+        _commit_with_outbox(history_doc, verification_details)
+
+
+def recover_pending_acceptances(limit=100):
+    """Finish acceptances left pending by a crash. Returns how many were completed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ACCEPTANCE_RECOVERY_AGE_SECONDS)
+    recovered = 0
+    for record in db.task_history.find({"pending_credit.at": {"$lt": cutoff}}).limit(limit):
+        try:
+            _apply(record, record["pending_credit"].get("verification_details"))
+        except WalletNotFound:
+            logger.error("Dropping pending acceptance %s: wallet not found", record["_id"])
+            db.task_history.delete_one({"_id": record["_id"]})
+            continue
+        except Exception as e:
+            logger.error("Error recovering pending acceptance %s: %s", record["_id"], e)
+            continue
+        db.task_history.update_one({"_id": record["_id"]}, {"$unset": {"pending_credit": ""}})
+        recovered += 1
+    if recovered:
+        logger.info("Recovered %s pending acceptances", recovered)
+    return recovered
+
+
+def _recovery_loop():
+    while True:
+        try:
+            recover_pending_acceptances()
+        except Exception as e:
+            logger.error("Error sweeping pending acceptances: %s", e)
+        time.sleep(ACCEPTANCE_RECOVERY_INTERVAL)
+
+
+def start_acceptance_recovery():
+    """Periodically finish acceptances interrupted between their writes."""
+    threading.Thread(target=_recovery_loop, name="acceptance-recovery", daemon=True).start()
@@ -13,7 +13,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017")
+client = MongoClient("mongodb://localhost:27017", connect=False)
 db = client["enoylity"]
 admins_collection = db["admins"]
 
@@ -55,8 +55,6 @@ def create_default_admin():
     except pymongo_errors.PyMongoError as e:
         logger.error("Error creating default admin: %s", e)
 
-create_default_admin()
-
 @admin_bp.route("/login", methods=["POST"])
 def login_admin():
     try:
@@ -1,16 +1,28 @@
+import multiprocessing
 from flask import Flask, jsonify
 from flask_cors import CORS
-from task_list import task_bp   
-from image_analysis import image_analysis_bp  
+from task_list import task_bp, ensure_task_indexes
+from image_analysis import image_analysis_bp, start_verify_job_workers
 from payment_details import payment_details_bp
-from user import user_bp
-from admin import admin_bp
+from user import user_bp, ensure_user_indexes
+from admin import admin_bp, create_default_admin
 from dashboard import dashboard_bp
-from payout import payout_bp
+from payout import payout_bp, ensure_payout_indexes
 from contact import contact_bp
 from download import download_bp
-from wallet import wallet_bp
+from wallet import wallet_bp, ensure_wallet_indexes
 from utils import utils_bp
+from phash_store import phash_bp
+from task_feed import start_feed_workers, ensure_feed_indexes
+from search_index import start_search_backfill, ensure_search_indexes
+from image_workers import get_image_pool
+from acceptance import start_acceptance_recovery, ensure_acceptance_indexes
+from payout_reconciler import start_payout_reconciler, ensure_reconciler_indexes
+from phash_index import ensure_phash_indexes, load_phash_index
+from submissions import ensure_submission_indexes
+from task_versions import ensure_task_version_indexes
+from verdict_cache import ensure_verdict_cache_indexes
+from payout_dispatch import start_payout_dispatcher
 app = Flask(__name__)
 
 # Configure Cross-Origin Resource Sharing (CORS)
@@ -30,6 +42,39 @@ app.register_blueprint(dashboard_bp)
 app.register_blueprint(download_bp)
 app.register_blueprint(wallet_bp)
 app.register_blueprint(utils_bp)
+app.register_blueprint(phash_bp)
+
+
+def ensure_indexes():
+    """Create every collection index the modules rely on (idempotent)."""
+    for ensure in (
+        ensure_task_indexes, ensure_user_indexes, ensure_payout_indexes, ensure_wallet_indexes,
+        ensure_feed_indexes, ensure_search_indexes, ensure_acceptance_indexes, ensure_reconciler_indexes,
+        ensure_phash_indexes, ensure_submission_indexes, ensure_task_version_indexes,
+        ensure_verdict_cache_indexes
+    ):
+        ensure()
+
+
+# Spawned image workers re-import this module, so nothing touches the database
+# at import time and only the parent process runs the startup below: the
+# default admin, indexes and the pHash index, then the (spawned) image process
+# pool and the workers for queued /image/api/verify submissions and task feed
+# fan-out, and indexing of any tasks/users not yet in the admin search index.
+# The acceptance sweeper finishes task credits interrupted by a crash, the
+# reconciler polls in-flight payouts in case a webhook is missed, and the
+# dispatcher pays out queued withdrawals.
+if multiprocessing.parent_process() is None:
+    create_default_admin()
+    ensure_indexes()
+    load_phash_index()
+    get_image_pool()
+    start_verify_job_workers()
+    start_feed_workers()
+    start_search_backfill()
+    start_acceptance_recovery()
+    start_payout_reconciler()
+    start_payout_dispatcher()
 
 # Global Error Handler: Resource Not Found
 
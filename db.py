@@ -1,3 +1,3 @@
 from pymongo import MongoClient
-client = MongoClient("mongodb://localhost:27017")
+client = MongoClient("mongodb://localhost:27017", connect=False)
 db = client["enoylity"]
\ No newline at end of file
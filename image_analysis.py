@@ -2,47 +2,101 @@ import os
 import base64
 import re
 import json
-import requests
 import hmac
 import hashlib
 from datetime import datetime, timedelta
-from io import BytesIO
 from flask import Flask, request, jsonify, Blueprint
 from werkzeug.utils import secure_filename
 from pymongo import MongoClient
 from dotenv import load_dotenv
-from PIL import Image
-import imagehash
 import logging
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
-from wallet import update_wallet_after_task
+from wallet import WalletNotFound
+from acceptance import commit_acceptance, AlreadyAccepted
+from phash_index import phash_index
+from verdict_cache import verdict_cache, verdict_cache_key
+from openai_client import openai_client, OpenAIUnavailable
+from image_workers import (
+    ImagePoolBusy, run_in_image_pool, compute_phash, preprocess_image, sniff_image_mime
+)
+from ocr_precheck import precheck_broadcast_screenshot, record as record_ocr_stat, ocr_stats
+from submissions import set_submission_status
+from task_catalog import task_catalog
+from task_versions import record_task_version, task_version
+from job_queue import JobWorkerPool, enqueue_job, ensure_job_indexes, set_job_progress
 from utils import format_response  # Centralized response formatter
 
 # Load environment variables
 load_dotenv()
 
 # Configuration from .env
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_URL = os.getenv("OPENAI_API_URL")
+OPENAI_CHECK_WORKERS = int(os.getenv("OPENAI_CHECK_WORKERS", "16"))
+# Vision detail per check: "high" for reading the link, "low" is enough for the recipients page.
+OPENAI_LINK_DETAIL = os.getenv("OPENAI_LINK_DETAIL", "high")
+OPENAI_GROUP_DETAIL = os.getenv("OPENAI_GROUP_DETAIL", "low")
+OPENAI_JPEG_QUALITY = int(os.getenv("OPENAI_JPEG_QUALITY", "85"))
+OPENAI_VISION_MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o")
+OPENAI_CHEAP_VISION_MODEL = os.getenv("OPENAI_CHEAP_VISION_MODEL", "gpt-4o-mini")
+# What to do when OCR confirms the link: "downgrade" to the cheap model, or "skip" OpenAI entirely.
+OCR_FASTPATH_MODE = os.getenv("OCR_FASTPATH_MODE", "downgrade")
+# Background verification jobs (mode=async on /image/api/verify).
+VERIFY_ASYNC_DEFAULT = os.getenv("VERIFY_ASYNC_DEFAULT", "0") == "1"
+VERIFY_JOB_WORKERS = int(os.getenv("VERIFY_JOB_WORKERS", "4"))
+VERIFY_JOB_LEASE_SECONDS = int(os.getenv("VERIFY_JOB_LEASE_SECONDS", "180"))
+MAX_JOB_IMAGE_BYTES = 15 * 1024 * 1024  # stay under Mongo's 16 MB document limit
 
 # Blueprints for image analysis and task management
 image_analysis_bp = Blueprint('image_analysis', __name__, url_prefix="/image")
 task_bp = Blueprint('task', __name__, url_prefix="/task")
 
 # MongoDB connection
-client = MongoClient("mongodb://localhost:27017")
+client = MongoClient("mongodb://localhost:27017", connect=False)
 db = client['enoylity']
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Prompt variants; bump when a prompt or the verdict shape changes so cached verdicts are not reused.
+LINK_CHECK_VARIANT = "broadcast-link-v1"
+GROUP_CHECK_VARIANT = "broadcast-group-v1"
+
+# Bounded pool shared by all requests for the two OpenAI vision checks.
+openai_check_executor = ThreadPoolExecutor(max_workers=OPENAI_CHECK_WORKERS, thread_name_prefix="openai-check")
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg'}
 
 def encode_image_to_base64_from_bytes(image_bytes):
     return base64.b64encode(image_bytes).decode('utf-8')
 
+def preprocess_image_for_openai(image_bytes, detail="high"):
+    """
+    Downscale and re-encode the image for the requested detail level in the image pool.
+    Returns (image_bytes, mime_type); falls back to the original bytes if the pool is
+    saturated or the image cannot be decoded.
+    """
+    try:
+        return run_in_image_pool(preprocess_image, image_bytes, detail, OPENAI_JPEG_QUALITY)
+    except ImagePoolBusy:
+        logger.warning("Image pool busy, sending original bytes")
+        return image_bytes, sniff_image_mime(image_bytes) or "image/jpeg"
+    except Exception:
+        logger.exception("Error preprocessing image, sending original bytes:")
+        return image_bytes, sniff_image_mime(image_bytes) or "image/jpeg"
+
+def build_image_content(image_bytes, detail):
+    """Build the image_url message part for a vision request."""
+    prepared_bytes, mime_type = preprocess_image_for_openai(image_bytes, detail)
+    base64_image = encode_image_to_base64_from_bytes(prepared_bytes)
+    logger.info("Encoded Image Length: %s (%s, detail=%s)", len(base64_image), mime_type, detail)
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:{mime_type};base64,{base64_image}", "detail": detail}
+    }
+
 def get_recent_task_links(days=3):
     """Fetch recent task links from the database within the specified number of days."""
     try:
@@ -54,13 +108,25 @@ def get_recent_task_links(days=3):
         logger.exception("Error fetching recent task links: %s", e)
         return []
 
-def analyze_image_with_openai_from_bytes(image_bytes, expected_link):
+def link_check_cache_key(image_bytes, expected_link, model=None):
+    variant = f"{LINK_CHECK_VARIANT}:{model or OPENAI_VISION_MODEL}:{OPENAI_LINK_DETAIL}"
+    return verdict_cache_key(image_bytes, variant, expected_link)
+
+def analyze_image_with_openai_from_bytes(image_bytes, expected_link, cancel_event=None, model=None):
     """
     Send the image to the OpenAI API for analysis, checking if it's a valid WhatsApp broadcast screenshot.
+    If `cancel_event` is set before the request is sent (or while waiting to retry), the call is abandoned.
     """
     try:
-        base64_image = encode_image_to_base64_from_bytes(image_bytes)
-        logger.info("Encoded Image Length: %s", len(base64_image))
+        if cancel_event is not None and cancel_event.is_set():
+            return {"verified": False, "message": "Link check cancelled"}
+        model = model or OPENAI_VISION_MODEL
+        cache_key = link_check_cache_key(image_bytes, expected_link, model)
+        cached = verdict_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Link check served from verdict cache")
+            return cached
+        image_content = build_image_content(image_bytes, OPENAI_LINK_DETAIL)
         prompt = (
             "Analyze this image and determine if it's a screenshot of a WhatsApp broadcast message.\n\n"
             "Specifically check for:\n"
@@ -76,24 +142,20 @@ def analyze_image_with_openai_from_bytes(image_bytes, expected_link):
             "- confidence_score (1-10)\n"
             "- reason (brief explanation)"
         ).format(expected_link)
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
-        }
         payload = {
-            "model": "gpt-4o",
+            "model": model,
             "messages": [
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                        image_content
                     ]
                 }
             ],
             "max_tokens": 500
         }
-        response = requests.post(OPENAI_API_URL, headers=headers, json=payload)
+        response = openai_client.post_chat(payload, cancel_event=cancel_event)
         logger.info("OpenAI Raw Response: %s", response.text)
         if response.status_code == 200:
             result = response.json()
@@ -112,17 +174,21 @@ def analyze_image_with_openai_from_bytes(image_bytes, expected_link):
                 content.get("is_broadcast_list", False) and
                 content.get("contains_expected_link", False)
             )
-            return {
-                "verified": verified,
+            verdict = {
+                "verified": bool(verified),
                 "message": "Image analyzed successfully",
                 "details": content
             }
+            verdict_cache.set(cache_key, variant, verdict)
+            return verdict
         else:
             return {
                 "verified": False,
                 "message": f"API Error: {response.status_code}",
                 "details": response.text
             }
+    except OpenAIUnavailable:
+        raise
     except Exception as e:
         logger.exception("Error processing image:")
         return {
@@ -135,7 +201,13 @@ def check_group_participants_from_bytes(image_bytes):
     Analyze the group image to determine participant count and broadcast list validity.
     """
     try:
-        base64_image = encode_image_to_base64_from_bytes(image_bytes)
+        variant = f"{GROUP_CHECK_VARIANT}:{OPENAI_VISION_MODEL}:{OPENAI_GROUP_DETAIL}"
+        cache_key = verdict_cache_key(image_bytes, variant)
+        cached = verdict_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Group check served from verdict cache")
+            return cached
+        image_content = build_image_content(image_bytes, OPENAI_GROUP_DETAIL)
         prompt = (
             "This image is a screenshot of a WhatsApp broadcast list information page. \n"
             "Determine the number of recipients and the name of the list.\n\n"
@@ -145,30 +217,27 @@ def check_group_participants_from_bytes(image_bytes):
             "- group_name (string)\n"
             "- reason (brief explanation)"
         )
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
-        }
         payload = {
-            "model": "gpt-4o",
+            "model": OPENAI_VISION_MODEL,
             "messages": [
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                        image_content
                     ]
                 }
             ],
             "max_tokens": 300
         }
-        response = requests.post(OPENAI_API_URL, headers=headers, json=payload)
+        response = openai_client.post_chat(payload)
         if response.status_code == 200:
             result = response.json()
             assistant_content = result["choices"][0]["message"]["content"]
             assistant_content_clean = re.sub(r"```(?:json)?", "", assistant_content).replace("```", "").strip()
             try:
                 content = json.loads(assistant_content_clean)
+                verdict_cache.set(cache_key, variant, content)
                 return content
             except json.JSONDecodeError:
                 return {
@@ -183,6 +252,8 @@ def check_group_participants_from_bytes(image_bytes):
             "reason": f"API error: {response.status_code}",
             "raw_response": response.text
         }
+    except OpenAIUnavailable:
+        raise
     except Exception as e:
         logger.exception("Error processing group image:")
         return {
@@ -191,12 +262,86 @@ def check_group_participants_from_bytes(image_bytes):
             "reason": str(e)
         }
 
+def check_broadcast_link(image_bytes, expected_link, cancel_event=None):
+    """
+    Link check with a local OCR fast path in front of OpenAI.
+    - OCR finds no URL-like text at all: rejected without calling OpenAI.
+    - OCR finds the exact link and broadcast markers: OPENAI_CHEAP_VISION_MODEL is used,
+      or OpenAI is skipped entirely when OCR_FASTPATH_MODE is "skip".
+    - Otherwise the full model is used.
+    A verdict already cached for the image under either model is returned before
+    any OCR, so a resubmission costs nothing.
+    """
+    for model in dict.fromkeys((OPENAI_VISION_MODEL, OPENAI_CHEAP_VISION_MODEL)):
+        cached = verdict_cache.get(link_check_cache_key(image_bytes, expected_link, model))
+        if cached is not None:
+            logger.info("Link check served from verdict cache before OCR")
+            return cached
+    precheck = precheck_broadcast_screenshot(image_bytes, expected_link)
+    outcome = precheck.get("outcome")
+    if outcome == "no_url":
+        record_ocr_stat("openai_calls_avoided")
+        return {
+            "verified": False,
+            "message": "No link found in the screenshot",
+            "details": {
+                "contains_expected_link": False,
+                "reason": "No URL-like text found in the screenshot",
+                "ocr_precheck": precheck
+            }
+        }
+    if outcome == "confirmed":
+        if OCR_FASTPATH_MODE == "skip":
+            record_ocr_stat("openai_calls_avoided")
+            return {
+                "verified": True,
+                "message": "Image verified by OCR",
+                "details": {
+                    "is_whatsapp_screenshot": True,
+                    "is_broadcast_list": True,
+                    "contains_expected_link": True,
+                    "reason": "Expected link and broadcast markers found by OCR",
+                    "ocr_precheck": precheck
+                }
+            }
+        record_ocr_stat("openai_calls_downgraded")
+        return analyze_image_with_openai_from_bytes(
+            image_bytes, expected_link, cancel_event, model=OPENAI_CHEAP_VISION_MODEL
+        )
+    record_ocr_stat("openai_calls_full")
+    return analyze_image_with_openai_from_bytes(image_bytes, expected_link, cancel_event)
+
+def run_openai_checks(image_bytes, group_image_bytes, expected_link):
+    """
+    Run the broadcast-list check and the link check concurrently.
+
+    Returns (group_check, result). If the group check fails, the link check is
+    cancelled and `result` is None, matching the sequential rejection order.
+    OpenAIUnavailable from either check is raised to the caller.
+    """
+    cancel_event = threading.Event()
+    group_future = openai_check_executor.submit(check_group_participants_from_bytes, group_image_bytes)
+    link_future = openai_check_executor.submit(
+        check_broadcast_link, image_bytes, expected_link, cancel_event
+    )
+    try:
+        group_check = group_future.result()
+    except OpenAIUnavailable:
+        cancel_event.set()
+        link_future.cancel()
+        raise
+    if not group_check.get("is_valid_group"):
+        cancel_event.set()
+        link_future.cancel()
+        return group_check, None
+    return group_check, link_future.result()
+
 def compute_phash_from_bytes(image_bytes):
-    """Compute the perceptual hash for an image given its byte content."""
+    """Compute the perceptual hash for an image given its byte content (in the image pool)."""
     try:
-        image_stream = BytesIO(image_bytes)
-        img = Image.open(image_stream)
-        return str(imagehash.phash(img))
+        return run_in_image_pool(compute_phash, image_bytes)
+    except ImagePoolBusy:
+        raise
     except Exception as e:
         logger.exception("Error computing pHash:")
         return None
@@ -204,28 +349,129 @@ def compute_phash_from_bytes(image_bytes):
 def is_duplicate_phash(new_phash, task_id, user_id, threshold=5):
     """Check if a similar image (based on pHash) already exists in the task history."""
     try:
-        history = list(db.task_history.find({"taskId": task_id, "verified": True}))
-        for record in history:
-            existing_phash = record.get("image_phash")
-            if existing_phash:
-                diff = imagehash.hex_to_hash(new_phash) - imagehash.hex_to_hash(existing_phash)
-                if diff <= threshold and record.get("userId") != user_id:
-                    return True
-        return False
+        return phash_index.is_duplicate(new_phash, task_id, user_id, threshold)
     except Exception as e:
         logger.exception("Error checking duplicate pHash:")
         return False
 
+def verify_submission(task_id, user_id, task_doc, image_bytes, group_image_bytes, uploaded_phash, progress=None):
+    """
+    Run the OpenAI checks for an already validated submission and record the outcome.
+    Returns (success, message, data, status) for format_response.
+    `progress`, if given, is called with a short label as each stage starts.
+    Raises OpenAIUnavailable, before anything is recorded, when OpenAI cannot be reached.
+    """
+    if progress:
+        progress("checking")
+    # Validate the broadcast list image and the broadcast message concurrently,
+    # using the task's message (link) as the expected link.
+    expected_link = task_doc.get("message", "")
+    group_check, result = run_openai_checks(image_bytes, group_image_bytes, expected_link)
+    logger.info("Group Check Response: %s", group_check)
+    if not group_check.get("is_valid_group"):
+        set_submission_status(task_id, user_id, "rejected", {"participant_check": group_check})
+        return (
+            False,
+            "Broadcast list must contain at least 2 recipients.",
+            {"participant_check": group_check, "status": "rejected"},
+            200
+        )
+
+    if progress:
+        progress("recording")
+    if result.get("verified"):
+        # Tasks created before versioning get their version recorded on first completion.
+        if "version" not in task_doc:
+            record_task_version(task_doc)
+        history_doc = {
+            "taskId": task_id,
+            "userId": user_id,
+            "matched_link": expected_link,
+            "task_name": task_doc.get("title", ""),
+            "participant_count": group_check.get("participant_count"),
+            "verified": True,
+            "verifiedAt": datetime.utcnow(),
+            "task_price": int(task_doc.get("task_price", 0)),
+            "image_phash": uploaded_phash,
+            "taskVersion": task_version(task_doc)
+        }
+        # History, wallet credit, ledger, submission status and feed are committed as one unit.
+        try:
+            commit_acceptance(history_doc, result.get("details", {}))
+        except AlreadyAccepted:
+            return False, "This user has already completed the task.", {"status": "already_done"}, 200
+        except WalletNotFound as e:
+            return False, str(e), {"error": str(e)}, 400
+        phash_index.add(task_id, user_id, uploaded_phash, history_doc["verifiedAt"])
+
+        return (
+            True,
+            "Image verified successfully.",
+            {
+                "matched_link": expected_link,
+                "group_name": group_check.get("group_name"),
+                "participant_count": group_check.get("participant_count"),
+                "verification_details": result.get("details", {}),
+                "status": "accepted"
+            },
+            200
+        )
+    else:
+        # Record the user's submission as rejected.
+        set_submission_status(task_id, user_id, "rejected", result.get("details", {}))
+        return (
+            False,
+            "No matching link found in the broadcast message screenshot",
+            {"participant_check": group_check, "verification_details": result.get("details", {}), "status": "rejected"},
+            200
+        )
+
+def process_verify_job(job):
+    """
+    Job handler: run a queued verification and return its response fields.
+    OpenAIUnavailable propagates so the job is requeued rather than the submission rejected.
+    """
+    task_doc = task_catalog.get_task(job["taskId"])
+    if not task_doc:
+        return {"success": False, "message": "Task not found", "data": None, "status": 404}
+    if db.task_history.find_one({"taskId": job["taskId"], "userId": job["userId"]}, {"_id": 1}):
+        return {"success": False, "message": "This user has already completed the task.",
+                "data": {"status": "already_done"}, "status": 200}
+    success, message, data, status = verify_submission(
+        job["taskId"], job["userId"], task_doc,
+        bytes(job["image"]), bytes(job["group_image"]), job["image_phash"],
+        progress=lambda stage: set_job_progress(db.verify_jobs, job["jobId"], stage)
+    )
+    return {"success": success, "message": message, "data": data, "status": status}
+
+verify_job_workers = JobWorkerPool(
+    db.verify_jobs, process_verify_job, "verify",
+    lease_seconds=VERIFY_JOB_LEASE_SECONDS, unset_on_finish=("image", "group_image")
+)
+
+def start_verify_job_workers():
+    """Start this process's share of background verification workers."""
+    ensure_job_indexes(db.verify_jobs)
+    try:
+        db.verify_jobs.create_index([("taskId", 1), ("userId", 1), ("status", 1)])
+    except Exception as e:
+        logger.error("Error creating verify job index: %s", e)
+    verify_job_workers.start(VERIFY_JOB_WORKERS)
+
 @image_analysis_bp.route('/api/verify', methods=['POST'])
 def verify_image():
     """
     Verify an image screenshot submission for a task. 
     Validates the screenshot, checks for duplicates, and verifies broadcast list details.
+
+    With form field mode=async (or VERIFY_ASYNC_DEFAULT=1) the submission is queued and a
+    jobId is returned immediately; poll /image/api/verify/status for the outcome.
     """
     try:
         # Retrieve taskId and userId from form data.
         task_id = request.form.get("taskId", "").strip()
         user_id = request.form.get("userId", "").strip()
+        mode = request.form.get("mode", "async" if VERIFY_ASYNC_DEFAULT else "sync").strip().lower()
     
         if not task_id:
             return format_response(False, "taskId is required", None, 400)
@@ -237,17 +483,11 @@ def verify_image():
         if existing_entry:
             return format_response(False, "This user has already completed the task.", {"status": "already_done"}, 200)
     
-        # Fetch the task document from the database.
-        task_doc = db.tasks.find_one({"taskId": task_id})
+        # Fetch the task document from the task catalog snapshot.
+        task_doc = task_catalog.get_task(task_id)
         if not task_doc:
             return format_response(False, "Task not found", None, 404)
     
-        # Mark the task as pending.
-        db.tasks.update_one(
-            {"taskId": task_id},
-            {"$set": {"status": "pending", "updatedAt": datetime.utcnow()}}
-        )
-    
         # Validate file uploads.
         if 'image' not in request.files or 'group_image' not in request.files:
             return format_response(False, "Both 'image' and 'group_image' files are required", None, 400)
@@ -274,81 +514,86 @@ def verify_image():
         # Check for duplicate screenshots.
         if is_duplicate_phash(uploaded_phash, task_id, user_id):
             return format_response(False, "Screenshot already used by another user", None, 400)
-    
-        # Validate the broadcast list image.
-        group_check = check_group_participants_from_bytes(group_image_bytes)
-        logger.info("Group Check Response: %s", group_check)
-        if not group_check.get("is_valid_group"):
-            db.tasks.update_one(
-                {"taskId": task_id},
-                {"$set": {"status": "rejected", "updatedAt": datetime.utcnow()}}
-            )
-            return format_response(
-                False,
-                "Broadcast list must contain at least 2 recipients.",
-                {"participant_check": group_check, "status": "rejected"},
-                200
-            )
-    
-        # Use the task's message (link) as the expected link.
-        expected_link = task_doc.get("message", "")
-        result = analyze_image_with_openai_from_bytes(image_bytes, expected_link)
-    
-        if result.get("verified"):
-            # Update task status to accepted.
-            db.tasks.update_one(
-                {"taskId": task_id},
-                {"$set": {
-                    "status": "accepted",
-                    "updatedAt": datetime.utcnow(),
-                    "verification_details": result.get("details", {})
-                }}
+
+        # Mark this user's submission as pending.
+        set_submission_status(task_id, user_id, "pending")
+
+        if mode == "async":
+            # Reuse an in-flight job for the same submission instead of queueing it twice.
+            active_job = db.verify_jobs.find_one(
+                {"taskId": task_id, "userId": user_id, "status": {"$in": ["queued", "running"]}},
+                {"_id": 0, "jobId": 1, "status": 1}
             )
-            history_doc = {
+            if active_job:
+                return format_response(True, "Verification already queued", active_job, 202)
+            if len(image_bytes) + len(group_image_bytes) > MAX_JOB_IMAGE_BYTES:
+                return format_response(False, "Images are too large to queue for verification", None, 413)
+            job_id = enqueue_job(db.verify_jobs, {
+                "kind": "verify",
                 "taskId": task_id,
                 "userId": user_id,
-                "matched_link": expected_link,
-                "task_name": task_doc.get("title", ""),
-                "participant_count": group_check.get("participant_count"),
-                "verified": True,
-                "verifiedAt": datetime.utcnow(),
-                "task_price": int(task_doc.get("task_price", 0)),
                 "image_phash": uploaded_phash,
-                "task_details": task_doc
-            }
-            db.task_history.insert_one(history_doc)
-            wallet_update = update_wallet_after_task(user_id, task_id, int(task_doc.get("task_price", 0)))
-            if "error" in wallet_update:
-                return format_response(False, wallet_update.get("error"), wallet_update, 400)
-    
-            return format_response(
-                True,
-                "Image verified successfully.",
-                {
-                    "matched_link": expected_link,
-                    "group_name": group_check.get("group_name"),
-                    "participant_count": group_check.get("participant_count"),
-                    "verification_details": result.get("details", {}),
-                    "status": "accepted"
-                },
-                200
-            )
-        else:
-            # Update task status to rejected.
-            db.tasks.update_one(
-                {"taskId": task_id},
-                {"$set": {
-                    "status": "rejected",
-                    "updatedAt": datetime.utcnow(),
-                    "verification_details": result.get("details", {})
-                }}
-            )
-            return format_response(
-                False,
-                "No matching link found in the broadcast message screenshot",
-                {"participant_check": group_check, "verification_details": result.get("details", {}), "status": "rejected"},
-                200
-            )
+                "image": image_bytes,
+                "group_image": group_image_bytes
+            })
+            return format_response(True, "Verification queued", {"jobId": job_id, "status": "queued"}, 202)
+
+        return format_response(*verify_submission(
+            task_id, user_id, task_doc, image_bytes, group_image_bytes, uploaded_phash
+        ))
+    except ImagePoolBusy:
+        return format_response(False, "Server is busy processing images, please retry shortly", None, 503)
+    except OpenAIUnavailable as e:
+        logger.warning("Verification deferred, OpenAI unavailable: %s", e)
+        return format_response(False, "Verification service is temporarily unavailable, please retry shortly", None, 503)
     except Exception as e:
         logger.exception("Error verifying image:")
-        return format_response(False, f"Server error: {str(e)}", None, 500)
\ No newline at end of file
+        return format_response(False, f"Server error: {str(e)}", None, 500)
+
+@image_analysis_bp.route('/api/verify/status', methods=['GET'])
+def verify_status():
+    """
+    GET /image/api/verify/status?jobId=<job_id>
+
+    Returns the job's status (queued, running, done or failed), its current
+    progress stage and, once done, the verification result.
+    """
+    try:
+        job_id = request.args.get("jobId", "").strip()
+        if not job_id:
+            return format_response(False, "jobId is required", None, 400)
+        job = db.verify_jobs.find_one({"jobId": job_id}, {"_id": 0, "image": 0, "group_image": 0})
+        if not job:
+            return format_response(False, "Job not found", None, 404)
+        return format_response(True, "Job status retrieved successfully", {
+            "jobId": job_id,
+            "taskId": job.get("taskId"),
+            "userId": job.get("userId"),
+            "status": job.get("status"),
+            "progress": job.get("progress"),
+            "attempts": job.get("attempts", 0),
+            "result": job.get("result"),
+            "error": job.get("lastError") if job.get("status") == "failed" else None,
+            "createdAt": job.get("createdAt"),
+            "finishedAt": job.get("finishedAt")
+        }, 200)
+    except Exception as e:
+        logger.exception("Error fetching verify job status:")
+        return format_response(False, f"Server error: {str(e)}", None, 500)
+
+@image_analysis_bp.route('/api/metrics', methods=['GET'])
+def openai_metrics():
+    """
+    GET /image/api/metrics
+
+    Returns OpenAI client counters (requests, retries, failures, short-circuited calls),
+    token usage, recent latency percentiles and the circuit breaker state, plus
+    OCR fast-path counters including the fraction of link checks that skipped OpenAI.
+    """
+    try:
+        return format_response(True, "Metrics retrieved successfully", {
+            "openai": openai_client.metrics(),
+            "ocr": ocr_stats()
+        }, 200)
+    except Exception as e:
+        return format_response(False, f"Server error: {str(e)}", None, 500)
@@ -0,0 +1,157 @@
+import os
+import threading
+import logging
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+import imagehash
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional.
+    pytesseract = None
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+IMAGE_POOL_SIZE = int(os.getenv("IMAGE_POOL_SIZE", str(os.cpu_count() or 2)))
+# Maximum jobs queued or running in the pool before new work is refused.
+IMAGE_POOL_MAX_PENDING = int(os.getenv("IMAGE_POOL_MAX_PENDING", str(IMAGE_POOL_SIZE * 4)))
+# How long a request waits for a queue slot before giving up.
+IMAGE_POOL_ACQUIRE_TIMEOUT = float(os.getenv("IMAGE_POOL_ACQUIRE_TIMEOUT", "2"))
+IMAGE_POOL_TASK_TIMEOUT = float(os.getenv("IMAGE_POOL_TASK_TIMEOUT", "30"))
+# Workers are spawned, not forked: by the time the pool starts, startup has already
+# started MongoClient monitor threads, which fork would copy in an undefined state.
+# A spawned worker re-imports the main module, so modules keep their database work
+# in explicit startup functions (see app.py) rather than at import.
+IMAGE_POOL_START_METHOD = os.getenv("IMAGE_POOL_START_METHOD", "spawn")
+
+
+class ImagePoolBusy(Exception):
+    """Raised when the image pool queue is full."""
+
+
+# CPU-bound image work (decode, pHash, resize/re-encode, OCR) runs in a warm process
+# pool so it never holds the GIL of a request thread. Functions executed in the pool
+# live here, and this module only imports PIL, imagehash and pytesseract, so spawned
+# worker processes start cheaply.
+
+def sniff_image_mime(image_bytes):
+    """Return the MIME type from the file signature, or None if it is not PNG/JPEG."""
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    return None
+
+
+def compute_phash(image_bytes):
+    """Perceptual hash of the image as a hex string."""
+    return str(imagehash.phash(Image.open(BytesIO(image_bytes))))
+
+
+def target_size_for_detail(width, height, detail):
+    """
+    Size the model actually looks at, so nothing larger is uploaded.
+    - low: fits within 512x512
+    - high: fits within 2048x2048, then the shortest side is at most 768px
+    Images are never upscaled.
+    """
+    if detail == "low":
+        scale = min(1.0, 512 / max(width, height))
+    else:
+        scale = min(1.0, 2048 / max(width, height))
+        scale = min(scale, 768 / min(width, height))
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+def preprocess_image(image_bytes, detail, jpeg_quality):
+    """
+    Downscale the image for the requested detail level and re-encode it as JPEG.
+    Returns (image_bytes, mime_type); the original bytes are kept when they are already smaller.
+    """
+    original_mime = sniff_image_mime(image_bytes) or "image/jpeg"
+    img = Image.open(BytesIO(image_bytes))
+    img.load()
+    size = target_size_for_detail(img.width, img.height, detail)
+    resized = size != img.size
+    if resized:
+        img = img.resize(size, Image.LANCZOS)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    output = BytesIO()
+    img.save(output, "JPEG", quality=jpeg_quality, optimize=True)
+    jpeg_bytes = output.getvalue()
+    if not resized and len(image_bytes) <= len(jpeg_bytes):
+        return image_bytes, original_mime
+    return jpeg_bytes, "image/jpeg"
+
+
+def ocr_image_text(image_bytes):
+    """Run Tesseract on the image."""
+    img = Image.open(BytesIO(image_bytes)).convert("L")
+    return pytesseract.image_to_string(img)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(IMAGE_POOL_MAX_PENDING)
+
+
+def get_image_pool():
+    """Return the process pool, starting and warming it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_POOL_SIZE,
+                mp_context=multiprocessing.get_context(IMAGE_POOL_START_METHOD)
+            )
+            for _ in range(IMAGE_POOL_SIZE):
+                _pool.submit(_warm_up)
+            logger.info("Started image process pool with %s workers", IMAGE_POOL_SIZE)
+        return _pool
+
+
+def _reset_pool(broken_pool):
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    broken_pool.shutdown(wait=False)
+
+
+def run_in_image_pool(fn, *args, timeout=IMAGE_POOL_TASK_TIMEOUT):
+    """
+    Run `fn(*args)` in the image pool and return its result.
+    Raises ImagePoolBusy when IMAGE_POOL_MAX_PENDING jobs are already in flight,
+    and concurrent.futures.TimeoutError when the job takes longer than `timeout`.
+    """
+    if not _slots.acquire(timeout=IMAGE_POOL_ACQUIRE_TIMEOUT):
+        raise ImagePoolBusy("Image processing queue is full")
+    pool = get_image_pool()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _reset_pool(pool)
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
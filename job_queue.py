@@ -0,0 +1,263 @@
+import os
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# A requeued job waits JOB_RETRY_BASE_DELAY * 2**(attempts - 1) seconds, capped, before it can be claimed again.
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+
+def ensure_job_indexes(collection):
+    """Indexes used to claim jobs, look them up by jobId and expire finished ones."""
+    try:
+        collection.create_index("jobId", unique=True)
+        collection.create_index([("status", 1), ("createdAt", 1)])
+        collection.create_index([("status", 1), ("lockedUntil", 1)])
+        collection.create_index("finishedAt", expireAfterSeconds=JOB_RETENTION_SECONDS)
+    except Exception as e:
+        logger.error("Error creating job indexes on %s: %s", collection.name, e)
+
+
+def enqueue_job(collection, payload):
+    """Persist a new queued job and return its jobId."""
+    now = datetime.utcnow()
+    job_id = str(ObjectId())
+    doc = dict(payload)
+    doc.update({
+        "jobId": job_id,
+        "status": "queued",
+        "progress": "queued",
+        "attempts": 0,
+        "lockedUntil": None,
+        "createdAt": now,
+        "updatedAt": now
+    })
+    collection.insert_one(doc)
+    return job_id
+
+
+def claim_job(collection, worker_id, lease_seconds):
+    """
+    Atomically claim the oldest queued job that is not backing off (see fail_job), or a
+    running job whose lease has expired (its worker died). Returns the claimed job document or None.
+    """
+    now = datetime.utcnow()
+    return collection.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "notBefore": {"$not": {"$gt": now}}},
+            {"status": "running", "lockedUntil": {"$lt": now}}
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "workerId": worker_id,
+                "lockedUntil": now + timedelta(seconds=lease_seconds),
+                "startedAt": now,
+                "updatedAt": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("createdAt", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def claim_jobs(collection, worker_id, lease_seconds, limit):
+    """Claim up to `limit` jobs, oldest first, for processing as one batch."""
+    jobs = []
+    while len(jobs) < limit:
+        job = claim_job(collection, worker_id, lease_seconds)
+        if job is None:
+            break
+        jobs.append(job)
+    return jobs
+
+
+def acquire_lease(collection, lease_id, owner, lease_seconds):
+    """
+    Take or renew a named lease stored in `collection`, so that only one process
+    runs a singleton loop at a time. Returns True if `owner` now holds it.
+    """
+    now = datetime.utcnow()
+    try:
+        collection.find_one_and_update(
+            {"_id": lease_id, "$or": [{"lockedUntil": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "lockedUntil": now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another owner holds the lease: the filter missed and the upsert collided with its document.
+        return False
+    return True
+
+
+def renew_job_lease(collection, job_id, worker_id, lease_seconds):
+    """Extend the lease of a job this worker is running. Returns False if it no longer holds it."""
+    now = datetime.utcnow()
+    result = collection.update_one(
+        {"jobId": job_id, "status": "running", "workerId": worker_id},
+        {"$set": {"lockedUntil": now + timedelta(seconds=lease_seconds), "updatedAt": now}}
+    )
+    return result.matched_count > 0
+
+
+def set_job_progress(collection, job_id, progress):
+    collection.update_one(
+        {"jobId": job_id},
+        {"$set": {"progress": progress, "updatedAt": datetime.utcnow()}}
+    )
+
+
+def complete_job(collection, job_id, worker_id, result, unset_fields=()):
+    """
+    Mark a job done, store its result and drop bulky payload fields.
+    Only applies while `worker_id` still holds the job; returns False if it lost the lease.
+    """
+    now = datetime.utcnow()
+    update = {"$set": {
+        "status": "done",
+        "progress": "done",
+        "result": result,
+        "lockedUntil": None,
+        "finishedAt": now,
+        "updatedAt": now
+    }}
+    if unset_fields:
+        update["$unset"] = {field: "" for field in unset_fields}
+    result = collection.update_one({"jobId": job_id, "status": "running", "workerId": worker_id}, update)
+    return result.matched_count > 0
+
+
+def retry_delay_seconds(attempts, base_delay=JOB_RETRY_BASE_DELAY):
+    return min(JOB_RETRY_MAX_DELAY, base_delay * (2 ** min(max(attempts - 1, 0), 20)))
+
+
+def fail_job(collection, job, worker_id, error, max_attempts, unset_fields=(),
+             retry_base_delay=JOB_RETRY_BASE_DELAY):
+    """
+    Requeue a failed job, or mark it failed once it has used up its attempts.
+    A requeued job is not claimed again until its exponential backoff has passed.
+    Only applies while `worker_id` still holds the job; returns False if it lost the lease.
+    """
+    now = datetime.utcnow()
+    owned = {"jobId": job["jobId"], "status": "running", "workerId": worker_id}
+    if job.get("attempts", 0) < max_attempts:
+        not_before = now + timedelta(seconds=retry_delay_seconds(job.get("attempts", 0), retry_base_delay))
+        result = collection.update_one(
+            owned,
+            {"$set": {
+                "status": "queued",
+                "lastError": error,
+                "lockedUntil": None,
+                "notBefore": not_before,
+                "updatedAt": now
+            }}
+        )
+        return result.matched_count > 0
+    update = {"$set": {
+        "status": "failed",
+        "progress": "failed",
+        "lastError": error,
+        "lockedUntil": None,
+        "finishedAt": now,
+        "updatedAt": now
+    }}
+    if unset_fields:
+        update["$unset"] = {field: "" for field in unset_fields}
+    result = collection.update_one(owned, update)
+    return result.matched_count > 0
+
+
+class JobWorkerPool:
+    """
+    Background threads that drain a Mongo-backed job collection.
+    Any number of processes can run a pool on the same collection; claims are atomic.
+    While a handler runs, a heartbeat thread keeps renewing its job's lease, so a
+    slow job is not re-claimed (and its side effects repeated) by another worker.
+    """
+
+    def __init__(self, collection, handler, name, lease_seconds=120, max_attempts=3,
+                 poll_interval=1.0, unset_on_finish=()):
+        self.collection = collection
+        self.handler = handler
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.unset_on_finish = tuple(unset_on_finish)
+        self._stop = threading.Event()
+        self._threads = []
+        self._active = {}  # jobId -> workerId of jobs running in this process
+        self._active_lock = threading.Lock()
+
+    def _worker_id(self, index):
+        return f"{socket.gethostname()}:{os.getpid()}:{self.name}-{index}"
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = claim_job(self.collection, worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error("Error claiming %s job: %s", self.name, e)
+                job = None
+            if not job:
+                self._stop.wait(self.poll_interval)
+                continue
+            with self._active_lock:
+                self._active[job["jobId"]] = worker_id
+            try:
+                result = self.handler(job)
+                if not complete_job(self.collection, job["jobId"], worker_id, result, self.unset_on_finish):
+                    logger.warning("Dropped result of %s job %s: lease lost", self.name, job["jobId"])
+            except Exception as e:
+                logger.exception("Error processing %s job %s:", self.name, job.get("jobId"))
+                try:
+                    if not fail_job(self.collection, job, worker_id, str(e), self.max_attempts, self.unset_on_finish):
+                        logger.warning("Dropped failure of %s job %s: lease lost", self.name, job["jobId"])
+                except Exception:
+                    logger.exception("Error recording %s job failure:", self.name)
+            finally:
+                with self._active_lock:
+                    self._active.pop(job["jobId"], None)
+
+    def _heartbeat(self):
+        # Renew well before expiry so one slow or failed renewal does not lose the lease.
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._active_lock:
+                active = list(self._active.items())
+            for job_id, worker_id in active:
+                try:
+                    if not renew_job_lease(self.collection, job_id, worker_id, self.lease_seconds):
+                        logger.warning("Lost the lease on %s job %s", self.name, job_id)
+                except Exception as e:
+                    logger.error("Error renewing %s job %s lease: %s", self.name, job_id, e)
+
+    def start(self, count):
+        """Start `count` worker threads (no-op if already started)."""
+        if self._threads or count <= 0:
+            return
+        for index in range(count):
+            thread = threading.Thread(
+                target=self._run, args=(self._worker_id(index),),
+                name=f"{self.name}-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name=f"{self.name}-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info("Started %s %s job workers", count, self.name)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,108 @@
+import os
+import re
+import threading
+import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from image_workers import ImagePoolBusy, run_in_image_pool, ocr_image_text, pytesseract
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# pytesseract is optional; without it every submission goes to OpenAI.
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1" and pytesseract is not None
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "10"))
+# Below this much recognised text the OCR result is too weak to reject on.
+OCR_MIN_TEXT_LENGTH = int(os.getenv("OCR_MIN_TEXT_LENGTH", "40"))
+
+URL_LIKE_PATTERN = re.compile(
+    r"(https?://|www\.|\b[a-z0-9-]+\.(com|in|net|org|io|ly|me|co|app|link|gl|page)\b)",
+    re.IGNORECASE
+)
+BROADCAST_MARKERS = ("broadcast", "recipient")
+WHATSAPP_MARKERS = BROADCAST_MARKERS + ("type a message", "end-to-end encrypted", "whatsapp", "forwarded")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "checks": 0,
+    "confirmed": 0,
+    "no_url": 0,
+    "inconclusive": 0,
+    "errors": 0,
+    "openai_calls_avoided": 0,
+    "openai_calls_downgraded": 0,
+    "openai_calls_full": 0
+}
+
+
+def _compact(text):
+    return re.sub(r"\s+", "", text or "").lower()
+
+
+def _strip_scheme(link):
+    return re.sub(r"^(https?|ftp)://", "", _compact(link)).rstrip("/")
+
+
+def record(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+
+def precheck_broadcast_screenshot(image_bytes, expected_link):
+    """
+    Read the screenshot locally and classify it:
+      - "confirmed": the expected link is present verbatim and WhatsApp broadcast markers are visible
+      - "no_url": plenty of text was read but neither the expected link nor anything URL-like
+      - "inconclusive": anything else, including OCR being unavailable or failing
+    Returns a dict with the outcome and the evidence behind it.
+    """
+    if not OCR_ENABLED:
+        return {"outcome": "inconclusive", "reason": "OCR disabled"}
+    record("checks")
+    try:
+        text = run_in_image_pool(ocr_image_text, image_bytes, timeout=OCR_TIMEOUT_SECONDS)
+    except ImagePoolBusy:
+        record("inconclusive")
+        return {"outcome": "inconclusive", "reason": "Image pool busy"}
+    except FutureTimeoutError:
+        record("errors")
+        record("inconclusive")
+        return {"outcome": "inconclusive", "reason": "OCR timed out"}
+    except Exception as e:
+        logger.exception("Error running OCR precheck:")
+        record("errors")
+        record("inconclusive")
+        return {"outcome": "inconclusive", "reason": f"OCR error: {str(e)}"}
+
+    lowered = (text or "").lower()
+    markers = [marker for marker in WHATSAPP_MARKERS if marker in lowered]
+    link = _strip_scheme(expected_link)
+    link_found = bool(link) and link in _compact(text)
+    has_url = bool(URL_LIKE_PATTERN.search(text or ""))
+
+    if link_found and any(marker in markers for marker in BROADCAST_MARKERS):
+        outcome = "confirmed"
+    elif not link_found and not has_url and len(lowered.strip()) >= OCR_MIN_TEXT_LENGTH:
+        outcome = "no_url"
+    else:
+        outcome = "inconclusive"
+    record(outcome)
+    return {
+        "outcome": outcome,
+        "link_found": link_found,
+        "url_like_text": has_url,
+        "whatsapp_markers": markers,
+        "text_length": len(lowered.strip())
+    }
+
+
+def ocr_stats():
+    """Counters for the OCR stage, including the fraction of OpenAI link checks it avoided."""
+    with _stats_lock:
+        stats = dict(_stats)
+    decided = stats["openai_calls_avoided"] + stats["openai_calls_downgraded"] + stats["openai_calls_full"]
+    stats["enabled"] = OCR_ENABLED
+    stats["avoided_fraction"] = stats["openai_calls_avoided"] / decided if decided else 0.0
+    stats["downgraded_fraction"] = stats["openai_calls_downgraded"] / decided if decided else 0.0
+    return stats
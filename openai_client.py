@@ -0,0 +1,263 @@
+import os
+import time
+import random
+import threading
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_URL = os.getenv("OPENAI_API_URL")
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "32"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_RESET_SECONDS = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class OpenAIUnavailable(Exception):
+    """Raised when OpenAI cannot answer right now: the breaker is open or every retry hit a transient error."""
+
+
+class CircuitOpenError(OpenAIUnavailable):
+    """Raised when the circuit breaker is open and OpenAI calls are being short-circuited."""
+
+
+class RequestCancelled(Exception):
+    """Raised when the caller cancels a request while it is waiting to retry."""
+
+
+def parse_retry_after(response):
+    """Return the server-requested delay in seconds, or None."""
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures; lets one trial call through after `reset_seconds`.
+    `allow()` returns None when the call is refused, otherwise a token identifying it; only the
+    token of the current half-open trial can release that trial through `abandon()`.
+    """
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial is not None:
+                return None
+            self._trial = object()
+            return self._trial
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = None
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def abandon(self, token):
+        """Release an allowed call that ended without an outcome (e.g. cancelled), so a trial can run again."""
+        with self._lock:
+            if token is self._trial:
+                self._trial = None
+
+
+class OpenAIClient:
+    """
+    Shared HTTP client for the chat completions endpoint: pooled keep-alive
+    connections, connect/read timeouts, jittered exponential backoff on 429/5xx
+    (honoring Retry-After), a circuit breaker and latency/token metrics.
+    Rate limiting (429) is retried but does not count towards opening the breaker.
+    """
+
+    def __init__(self, api_url, api_key, pool_size=OPENAI_POOL_SIZE,
+                 connect_timeout=OPENAI_CONNECT_TIMEOUT, read_timeout=OPENAI_READ_TIMEOUT,
+                 max_retries=OPENAI_MAX_RETRIES, backoff_base=OPENAI_BACKOFF_BASE,
+                 backoff_max=OPENAI_BACKOFF_MAX):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_RESET_SECONDS)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "short_circuited": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self._counters[name] += amount
+
+    def _record_usage(self, response):
+        try:
+            usage = response.json().get("usage") or {}
+        except ValueError:
+            return
+        with self._metrics_lock:
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                self._counters[key] += int(usage.get(key, 0) or 0)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: uniform between 0 and the exponential cap.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _sleep(self, delay, cancel_event):
+        if cancel_event is None:
+            time.sleep(delay)
+        elif cancel_event.wait(delay):
+            raise RequestCancelled("OpenAI request cancelled")
+
+    def post_chat(self, payload, cancel_event=None):
+        """
+        POST a chat completion payload and return the final requests.Response.
+        Raises CircuitOpenError when short-circuited, RequestCancelled when
+        `cancel_event` is set while waiting to retry, and OpenAIUnavailable when
+        every attempt failed with a network error or a retryable status.
+        """
+        # Token of the breaker-allowed call whose outcome is not recorded yet; a call that
+        # ends any other way releases it, so a half-open trial is not held forever.
+        token = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelled("OpenAI request cancelled")
+                token = self.breaker.allow()
+                if token is None:
+                    self._count("short_circuited")
+                    raise CircuitOpenError("OpenAI circuit breaker is open")
+                self._count("requests")
+                started = time.monotonic()
+                try:
+                    response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+                except requests.RequestException as e:
+                    self._count("failures")
+                    self.breaker.record_failure()
+                    token = None
+                    if attempt >= self.max_retries:
+                        raise OpenAIUnavailable(f"OpenAI request failed: {e}") from e
+                    logger.warning("OpenAI request failed (%s), retrying", e)
+                    self._count("retries")
+                    self._sleep(self._backoff(attempt), cancel_event)
+                    continue
+                finally:
+                    with self._metrics_lock:
+                        self._latencies.append(time.monotonic() - started)
+
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    self._count("failures")
+                    if response.status_code == 429:
+                        # Rate limiting means OpenAI is up; don't let it trip the breaker.
+                        self.breaker.abandon(token)
+                    else:
+                        self.breaker.record_failure()
+                    token = None
+                    if attempt >= self.max_retries:
+                        raise OpenAIUnavailable(f"OpenAI returned {response.status_code}")
+                    delay = self._backoff(attempt, parse_retry_after(response))
+                    logger.warning("OpenAI returned %s, retrying in %.2fs", response.status_code, delay)
+                    self._count("retries")
+                    self._sleep(delay, cancel_event)
+                    continue
+
+                self.breaker.record_success()
+                token = None
+                self._count("successes")
+                if response.status_code == 200:
+                    self._record_usage(response)
+                return response
+        finally:
+            if token is not None:
+                self.breaker.abandon(token)
+
+    def metrics(self):
+        """Snapshot of request counters, token usage and recent latency percentiles (seconds)."""
+        with self._metrics_lock:
+            counters = dict(self._counters)
+            latencies = sorted(self._latencies)
+        if latencies:
+            counters["latency_p50"] = latencies[len(latencies) // 2]
+            counters["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            counters["latency_avg"] = sum(latencies) / len(latencies)
+        counters["circuit_state"] = self.breaker.state
+        return counters
+
+
+openai_client = OpenAIClient(OPENAI_API_URL, OPENAI_API_KEY)
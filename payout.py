@@ -1,11 +1,24 @@
 import os
+import re
+import time
+import hmac
+import hashlib
 import datetime
+import threading
 import requests
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor, wait
 from requests.auth import HTTPBasicAuth
 from flask import Blueprint, request, jsonify
+from pymongo import UpdateOne, ReturnDocument
 from db import db
 from dotenv import load_dotenv
-from utils import format_response  # Centralized response formatter
+from job_queue import enqueue_job
+from utils import format_response, keyset_query, next_cursor, InvalidCursor  # Centralized response formatter
+from wallet import (
+    refund_withdrawal, reserve_funds, commit_hold, release_hold,
+    WalletNotFound, InsufficientBalance, WALLET_HOLD_TTL_SECONDS
+)
 import logging
 
 # Configure logging.
@@ -19,174 +32,534 @@ RAZORPAY_BASE_URL = 'https://api.razorpay.com/v1'
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
 RAZORPAYX_ACCOUNT_NO = os.getenv("RAZORPAYX_ACCOUNT_NO")
+RAZORPAY_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_TIMEOUT_SECONDS", "10"))
+# Status refreshes for /payout/status and /payout/history: concurrent fetches,
+# a process-wide request rate, and how long one API request may wait for them.
+PAYOUT_REFRESH_WORKERS = int(os.getenv("PAYOUT_REFRESH_WORKERS", "8"))
+RAZORPAY_MAX_REQUESTS_PER_SECOND = float(os.getenv("RAZORPAY_MAX_REQUESTS_PER_SECOND", "10"))
+PAYOUT_REFRESH_DEADLINE_SECONDS = float(os.getenv("PAYOUT_REFRESH_DEADLINE_SECONDS", "3"))
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+# "mode": "queue" on /payout/withdraw, or PAYOUT_QUEUE_DEFAULT=1, records the
+# withdrawal and leaves the Razorpay calls to payout_dispatch.
+PAYOUT_QUEUE_DEFAULT = os.getenv("PAYOUT_QUEUE_DEFAULT", "0") == "1"
+# Queued withdrawals hold their funds until dispatched, which can take a while on peak days.
+PAYOUT_QUEUE_HOLD_TTL_SECONDS = int(os.getenv("PAYOUT_QUEUE_HOLD_TTL_SECONDS", str(2 * 24 * 3600)))
+
+# Razorpay payout statuses by how far along they are; a status is never replaced
+# by one of lower rank, so late or out-of-order deliveries cannot move a payout back.
+PAYOUT_STATUS_RANK = {
+    "queued": 0, "pending": 0, "on-hold": 0, "scheduled": 0,
+    "processing": 1,
+    "processed": 2, "failed": 2, "rejected": 2, "cancelled": 2,
+    "reversed": 3
+}
+# Final statuses never change, except that a processed payout can still be reversed.
+PAYOUT_FINAL_STATUSES = ("processed", "failed", "rejected", "cancelled", "reversed")
+WEBHOOK_PAYOUT_EVENTS = ("payout.processed", "payout.failed", "payout.reversed")
+# Final statuses in which the money never left, or came back: the withdrawal is refunded.
+PAYOUT_REFUND_STATUSES = ("failed", "rejected", "cancelled", "reversed")
+
+def ensure_payout_indexes():
+    """Indexes backing the payout listings."""
+    try:
+        db.payouts.create_index([("created_at", -1), ("_id", -1)])
+        db.payouts.create_index([("userId", 1), ("created_at", -1)])
+        db.payouts.create_index("payout_id")
+        db.payouts.create_index("hold_id", sparse=True)
+        db.payout_events.create_index("payout_id")
+    except Exception as e:
+        logger.error("Error creating payout indexes: %s", e)
 
-def razorpay_post(endpoint, data):
+def razorpay_post(endpoint, data, headers=None, timeout=RAZORPAY_TIMEOUT_SECONDS):
     url = f"{RAZORPAY_BASE_URL}/{endpoint}"
-    response = requests.post(url, json=data, auth=HTTPBasicAuth(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    response = requests.post(url, json=data, auth=HTTPBasicAuth(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET),
+                             headers=headers, timeout=timeout)
     response.raise_for_status()
     return response.json()
 
-def razorpay_get(endpoint):
+def razorpay_get(endpoint, timeout=RAZORPAY_TIMEOUT_SECONDS):
     url = f"{RAZORPAY_BASE_URL}/{endpoint}"
-    response = requests.get(url, auth=HTTPBasicAuth(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    response = requests.get(url, auth=HTTPBasicAuth(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), timeout=timeout)
     response.raise_for_status()
     return response.json()
 
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads of the process."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def acquire(self, deadline):
+        """Wait for a slot; returns False without waiting if the slot falls after `deadline`."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_at)
+            if slot > deadline:
+                return False
+            self._next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+razorpay_rate_limiter = RateLimiter(RAZORPAY_MAX_REQUESTS_PER_SECOND)
+payout_refresh_executor = ThreadPoolExecutor(max_workers=PAYOUT_REFRESH_WORKERS, thread_name_prefix="payout-refresh")
+
+def _fetch_payout_status(payout_id, deadline):
+    if not razorpay_rate_limiter.acquire(deadline):
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return None
+    return razorpay_get(f"payouts/{payout_id}", timeout=remaining).get("status", "")
+
+def refresh_payout_statuses(payouts, deadline_seconds=PAYOUT_REFRESH_DEADLINE_SECONDS):
+    """
+    Refresh `status_detail` of the given payout documents from Razorpay in place,
+    concurrently and within the rate limit. Payouts not refreshed before the
+    deadline keep their last known status. Changes are saved with one bulk_write.
+    Statuses normally arrive through /payout/webhook; this is only used on request.
+    """
+    deadline = time.monotonic() + deadline_seconds
+    futures = {
+        payout_refresh_executor.submit(_fetch_payout_status, payout["payout_id"], deadline): payout
+        for payout in payouts if payout.get("payout_id")
+    }
+    if not futures:
+        return
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        logger.info("Payout refresh deadline reached; %s of %s payouts keep their last status", len(not_done), len(futures))
+
+    operations, declined_ids = [], []
+    for future in done:
+        payout = futures[future]
+        try:
+            new_status = future.result()
+        except Exception as ex:
+            logger.warning("Failed to update status for payout %s: %s", payout["payout_id"], str(ex))
+            continue
+        current = payout.get("status_detail", "").lower()
+        query = status_update_filter(payout["payout_id"], new_status)
+        if query and status_may_change(current, new_status):
+            payout["status_detail"] = new_status
+            operations.append(UpdateOne(query, {"$set": {
+                "status_detail": new_status,
+                "status_source": "refresh",
+                "status_updated_at": datetime.datetime.utcnow()
+            }}))
+            if new_status.lower() in PAYOUT_REFUND_STATUSES:
+                declined_ids.append(payout["payout_id"])
+    if operations:
+        db.payouts.bulk_write(operations, ordered=False)
+    for payout_id in declined_ids:
+        refund_if_declined(payout_id)
+
 def map_status(status_raw):
     status_raw = status_raw.lower()
     if status_raw in ["processing"]:
         return "Processing"
     elif status_raw in ["failed", "rejected", "cancelled"]:
         return "Declined"
-    elif status_raw in ["queued", "pending", "on-hold", "scheduled"]:
+    elif status_raw in ["requested", "queued", "pending", "on-hold", "scheduled"]:
         return "Pending"
     elif status_raw in ["processed"]:
         return "Processed"
     else:
         return status_raw.capitalize()
 
+def status_may_change(current, new_status):
+    """Whether a payout in `current` status may move to `new_status`."""
+    current, new_status = (current or "").lower(), (new_status or "").lower()
+    if new_status not in PAYOUT_STATUS_RANK or new_status == current:
+        return False
+    if current in PAYOUT_FINAL_STATUSES:
+        return current == "processed" and new_status == "reversed"
+    return PAYOUT_STATUS_RANK.get(current, -1) <= PAYOUT_STATUS_RANK[new_status]
+
+def status_update_filter(payout_id, new_status):
+    """Filter matching the payout only while its status may still move to `new_status`, or None."""
+    if (new_status or "").lower() not in PAYOUT_STATUS_RANK:
+        return None
+    replaceable = [status for status in PAYOUT_STATUS_RANK if status_may_change(status, new_status)]
+    return {"payout_id": payout_id, "$or": [
+        {"status_detail": {"$in": replaceable}},
+        {"status_detail": {"$exists": False}}
+    ]}
+
+def apply_payout_status(payout_id, new_status, source, extra=None):
+    """
+    Move a payout to `new_status` unless it already has that status, a later one or a final one.
+    Returns the payout as it was before the change, or None if nothing changed.
+    """
+    query = status_update_filter(payout_id, new_status)
+    if query is None:
+        return None
+    update_fields = {
+        "status_detail": new_status.lower(),
+        "status_source": source,
+        "status_updated_at": datetime.datetime.utcnow()
+    }
+    update_fields.update(extra or {})
+    return db.payouts.find_one_and_update(
+        query,
+        {"$set": update_fields},
+        return_document=ReturnDocument.BEFORE
+    )
+
+def refund_if_declined(payout_id):
+    """
+    Return the amount of a failed or reversed payout to the user's wallet, once.
+    The payout's wallet_reversed flag and the wallet's credit guard together make
+    this safe to call repeatedly and concurrently. Returns True if refunded now.
+    """
+    payout = db.payouts.find_one(
+        {"payout_id": payout_id, "status_detail": {"$in": list(PAYOUT_REFUND_STATUSES)}, "wallet_reversed": {"$ne": True}},
+        {"userId": 1, "amount": 1}
+    )
+    if not payout:
+        return False
+    refunded = refund_withdrawal(payout["userId"], payout_id, float(payout.get("amount", 0)))
+    db.payouts.update_one(
+        {"payout_id": payout_id},
+        {"$set": {"wallet_reversed": True, "wallet_reversed_at": datetime.datetime.utcnow()}}
+    )
+    if refunded:
+        logger.info("Refunded %s to user %s for payout %s", payout.get("amount"), payout["userId"], payout_id)
+    return refunded
+
+def verify_webhook_signature(body, signature):
+    if not RAZORPAY_WEBHOOK_SECRET or not signature:
+        return False
+    expected = hmac.new(RAZORPAY_WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+@payout_bp.route("/webhook", methods=["POST"])
+def payout_webhook():
+    """
+    POST /payout/webhook
+
+    Razorpay webhook for payout.processed, payout.failed and payout.reversed.
+    The body must carry a valid X-Razorpay-Signature (HMAC-SHA256 with
+    RAZORPAY_WEBHOOK_SECRET). Redelivered events (same X-Razorpay-Event-Id)
+    are acknowledged without being applied again.
+    """
+    try:
+        body = request.get_data()
+        if not verify_webhook_signature(body, request.headers.get("X-Razorpay-Signature", "")):
+            return format_response(False, "Invalid signature", None, 400)
+        event = request.get_json(force=True, silent=True) or {}
+        event_type = event.get("event", "")
+        event_id = request.headers.get("X-Razorpay-Event-Id") or event.get("id")
+        entity = ((event.get("payload") or {}).get("payout") or {}).get("entity") or {}
+        payout_id = entity.get("id")
+
+        if event_type not in WEBHOOK_PAYOUT_EVENTS or not payout_id:
+            return format_response(True, "Event ignored", {"event": event_type}, 200)
+        if event_id and db.payout_events.find_one({"_id": event_id}, {"_id": 1}):
+            return format_response(True, "Event already processed", {"event_id": event_id}, 200)
+
+        extra = {}
+        if entity.get("utr"):
+            extra["utr"] = entity["utr"]
+        if entity.get("failure_reason"):
+            extra["failure_reason"] = entity["failure_reason"]
+        new_status = (entity.get("status") or event_type.split(".", 1)[1]).lower()
+        previous = apply_payout_status(payout_id, new_status, "webhook", extra)
+        if new_status in PAYOUT_REFUND_STATUSES:
+            refund_if_declined(payout_id)
+
+        # Applying a status is idempotent, so the event is recorded only afterwards.
+        if event_id:
+            db.payout_events.update_one(
+                {"_id": event_id},
+                {"$setOnInsert": {
+                    "event": event_type,
+                    "payout_id": payout_id,
+                    "status": entity.get("status"),
+                    "applied": previous is not None,
+                    "received_at": datetime.datetime.utcnow()
+                }},
+                upsert=True
+            )
+        return format_response(True, "Event processed", {"payout_id": payout_id, "applied": previous is not None}, 200)
+    except Exception as e:
+        logger.exception("Error processing payout webhook:")
+        return format_response(False, f"Server error: {str(e)}", None, 500)
+
+class WithdrawalError(Exception):
+    """
+    A Razorpay step of a withdrawal failed; carries the response message and details.
+    `retryable` marks server-side failures, where the request may still have taken effect.
+    """
+
+    def __init__(self, message, details=None, status=500, retryable=False):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status = status
+        self.retryable = retryable
+
+def _is_server_error(error):
+    return error.response is None or error.response.status_code >= 500
+
+def load_withdrawal_account(user_id, payment_type):
+    """The user and their payment method for `payment_type`, in one round trip."""
+    accounts = list(db.users.aggregate([
+        {"$match": {"userId": user_id}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "payment",
+            "let": {"userId": "$userId"},
+            "pipeline": [
+                {"$match": {"paymentMethod": payment_type, "$expr": {"$eq": ["$userId", "$$userId"]}}},
+                {"$limit": 1}
+            ],
+            "as": "payment"
+        }}
+    ]))
+    if not accounts:
+        return None, None
+    user = accounts[0]
+    payments = user.pop("payment", [])
+    return user, payments[0] if payments else None
+
+def fund_account_type_for(payment_type):
+    return "bank_account" if payment_type == 1 else "vpa"
+
+def create_contact(user):
+    """Create the user's Razorpay contact and return its id; raises WithdrawalError."""
+    contact_data = {
+        "name": user["name"],
+        "email": user["email"],
+        "contact": user["phone"],
+        "type": "employee"
+    }
+    try:
+        return razorpay_post("contacts", contact_data)["id"]
+    except requests.HTTPError as e:
+        logger.exception("Failed to create Razorpay contact:")
+        details = e.response.json() if e.response else str(e)
+        raise WithdrawalError("Failed to create contact", {"details": details}, retryable=_is_server_error(e))
+
+def create_fund_account(contact_id, payment, payment_type):
+    """Create a bank (1) or UPI (0) fund account and return its id; raises WithdrawalError."""
+    try:
+        if payment_type == 1:
+            fund_payload = {
+                "contact_id": contact_id,
+                "account_type": "bank_account",
+                "bank_account": {
+                    "name": payment["accountHolder"],
+                    "ifsc": payment["ifsc"],
+                    "account_number": payment["accountNumber"]
+                }
+            }
+        else:
+            fund_payload = {
+                "contact_id": contact_id,
+                "account_type": "vpa",
+                "vpa": {
+                    "address": payment["upiId"]
+                }
+            }
+        fund_account_id = razorpay_post("fund_accounts", fund_payload)["id"]
+        logger.info("Fund account created: %s", fund_account_id)
+        return fund_account_id
+    except requests.HTTPError as e:
+        logger.exception("Failed to create fund account:")
+        details = e.response.json() if e.response else str(e)
+        raise WithdrawalError("Failed to create fund account. Please add valid bank or UPI.", {"details": details},
+                              retryable=_is_server_error(e))
+
+def fund_account_fields(payment_type, fund_account_id):
+    """User fields caching a created fund account."""
+    return {
+        f"razorpay_fund_account_id_{payment_type}": fund_account_id,
+        f"razorpay_fund_account_type_{payment_type}": fund_account_type_for(payment_type)
+    }
+
+def create_payout(fund_account_id, payment_type, amount, reference_id):
+    """Create the payout itself; raises WithdrawalError."""
+    if not RAZORPAYX_ACCOUNT_NO:
+        raise WithdrawalError("Missing RazorpayX account number in config")
+
+    payout_payload = {
+        "account_number": RAZORPAYX_ACCOUNT_NO,
+        "fund_account_id": fund_account_id,
+        "amount": int(round(amount * 100)),  # rupees to paise
+        "currency": "INR",
+        "mode": "IMPS" if payment_type == 1 else "UPI",
+        "purpose": "payout",
+        "queue_if_low_balance": True,
+        "reference_id": reference_id,
+        "narration": "User Withdrawal"
+    }
+    try:
+        # The reference doubles as the idempotency key, so a retried request cannot pay twice.
+        return razorpay_post("payouts", payout_payload, headers={"X-Payout-Idempotency": reference_id})
+    except requests.HTTPError as e:
+        details = e.response.json() if e.response else str(e)
+        logger.exception("Payout failed:")
+        raise WithdrawalError("Payout failed", {"details": details}, retryable=_is_server_error(e))
+
+def create_razorpay_payout(user, payment, payment_type, amount, reference_id):
+    """
+    Create the contact and fund account if missing, then the payout.
+    Returns (payout, fund_account_id, fund_account_status); raises WithdrawalError.
+    """
+    user_id = user["userId"]
+
+    # Step 1: Create Razorpay Contact if missing.
+    contact_id = user.get("razorpay_contact_id")
+    if not contact_id:
+        contact_id = create_contact(user)
+        db.users.update_one({"userId": user_id}, {"$set": {"razorpay_contact_id": contact_id}})
+
+    # Step 2: Create or fetch Fund Account.
+    fund_account_id = user.get(f"razorpay_fund_account_id_{payment_type}")
+    fund_account_status = "fetched"
+    if not fund_account_id:
+        fund_account_id = create_fund_account(contact_id, payment, payment_type)
+        fund_account_status = "created"
+        db.users.update_one({"userId": user_id}, {"$set": fund_account_fields(payment_type, fund_account_id)})
+    else:
+        logger.info("Fund account fetched from DB: %s", fund_account_id)
+
+    payout = create_payout(fund_account_id, payment_type, amount, reference_id)
+    return payout, fund_account_id, fund_account_status
+
+def find_razorpay_payout(reference_id):
+    """The Razorpay payout created with `reference_id`, or None."""
+    response = razorpay_get(f"payouts?account_number={RAZORPAYX_ACCOUNT_NO}&reference_id={reference_id}")
+    items = response.get("items") or []
+    return items[0] if items else None
+
+def payout_record_update(user_id, payout, fund_account_id, fund_account_status, payment_type, hold_id):
+    """(filter, update) saving a created payout on the record for its hold, creating the record if needed."""
+    return (
+        {"hold_id": hold_id},
+        {
+            "$set": {
+                "payout_id": payout["id"],
+                "amount": payout["amount"] / 100,
+                "status_detail": payout["status"],
+                "fund_account_id": fund_account_id,
+                "fund_account_status": fund_account_status,
+                "fund_account_type": fund_account_type_for(payment_type)
+            },
+            "$setOnInsert": {"userId": user_id, "created_at": datetime.datetime.utcnow()}
+        }
+    )
+
+def record_payout(user_id, payout, fund_account_id, fund_account_status, payment_type, hold_id):
+    """
+    Save the payout and turn its hold into a withdrawal. A payout found already
+    failed or reversed is refunded straight away, as no later status change will do it.
+    """
+    db.payouts.update_one(
+        *payout_record_update(user_id, payout, fund_account_id, fund_account_status, payment_type, hold_id),
+        upsert=True
+    )
+    commit_hold(user_id, hold_id, payout["id"])
+    refund_if_declined(payout["id"])
+
+def enqueue_withdrawal(user_id, amount, payment_type, hold_id):
+    """
+    Record a withdrawal whose funds are already held and queue it for dispatch.
+    Its payout record shows as Pending on /payout/status until dispatched.
+    """
+    db.payouts.insert_one({
+        "userId": user_id,
+        "payout_id": None,
+        "hold_id": hold_id,
+        "amount": amount,
+        "status_detail": "requested",
+        "fund_account_type": fund_account_type_for(payment_type),
+        "created_at": datetime.datetime.utcnow()
+    })
+    return enqueue_job(db.payout_jobs, {
+        "kind": "withdrawal",
+        "userId": user_id,
+        "amount": amount,
+        "paymentType": payment_type,
+        "holdId": hold_id
+    })
+
 @payout_bp.route("/withdraw", methods=["POST"])
 def withdraw_funds():
+    """
+    POST /payout/withdraw
+    JSON Body:
+    {
+      "userId": "user123",
+      "amount": 500,       # rupees
+      "paymentType": 0,    # 0 for UPI, 1 for bank
+      "mode": "sync"       # optional, "queue" to return at once and let the dispatcher pay out
+    }
+    """
     try:
         data = request.get_json() or {}
         user_id = data.get("userId")
         amount = data.get("amount")  # in rupees
         payment_type = data.get("paymentType")  # 0 for UPI, 1 for bank
+        mode = data.get("mode", "queue" if PAYOUT_QUEUE_DEFAULT else "sync")
 
         if not user_id or not amount or payment_type is None:
             return format_response(False, "userId, amount and paymentType are required", None, 400)
+        try:
+            amount = float(amount)
+            if amount <= 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            return format_response(False, "amount must be a positive number", None, 400)
+        # Razorpay pays whole paise; the hold must reserve exactly what is paid out.
+        if round(amount, 2) != amount:
+            return format_response(False, "amount can have at most 2 decimal places", None, 400)
+        if payment_type not in (0, 1):
+            return format_response(False, "Invalid paymentType. Use 0 for UPI or 1 for Bank", None, 400)
 
-        user = db.users.find_one({"userId": user_id})
+        user, payment = load_withdrawal_account(user_id, payment_type)
         if not user:
             return format_response(False, "User not found", None, 404)
-
-        # Check wallet balance.
-        wallet = db.wallet.find_one({"userId": user_id})
-        if not wallet:
-            return format_response(False, "Wallet not found for user", None, 404)
-        if wallet.get("balance", 0) < float(amount):
-            return format_response(False, "Insufficient wallet balance", None, 400)
-
-        # Determine payment method.
-        if payment_type == 1:
-            payment = db.payment.find_one({"userId": user_id, "paymentMethod": 1})
-            fund_account_type = "bank_account"
-        elif payment_type == 0:
-            payment = db.payment.find_one({"userId": user_id, "paymentMethod": 0})
-            fund_account_type = "vpa"
-        else:
-            return format_response(False, "Invalid paymentType. Use 0 for UPI or 1 for Bank", None, 400)
-
         if not payment:
             return format_response(False, "No payment method found for selected type.", None, 400)
 
-        # Step 1: Create Razorpay Contact if missing.
-        contact_id = user.get("razorpay_contact_id")
-        if not contact_id:
-            contact_data = {
-                "name": user["name"],
-                "email": user["email"],
-                "contact": user["phone"],
-                "type": "employee"
-            }
-            try:
-                contact = razorpay_post("contacts", contact_data)
-                contact_id = contact['id']
-                db.users.update_one(
-                    {"userId": user_id},
-                    {"$set": {"razorpay_contact_id": contact_id}}
-                )
-            except requests.HTTPError as e:
-                logger.exception("Failed to create Razorpay contact:")
-                details = e.response.json() if e.response else str(e)
-                return format_response(False, "Failed to create contact", {"details": details}, 500)
-
-        # Step 2: Create or fetch Fund Account.
-        fund_account_id_key = f"razorpay_fund_account_id_{payment_type}"
-        fund_account_type_key = f"razorpay_fund_account_type_{payment_type}"
-
-        fund_account_id = user.get(fund_account_id_key)
-        fund_account_status = "fetched"
-        if not fund_account_id:
-            try:
-                if payment_type == 1:
-                    fund_payload = {
-                        "contact_id": contact_id,
-                        "account_type": "bank_account",
-                        "bank_account": {
-                            "name": payment["accountHolder"],
-                            "ifsc": payment["ifsc"],
-                            "account_number": payment["accountNumber"]
-                        }
-                    }
-                else:
-                    fund_payload = {
-                        "contact_id": contact_id,
-                        "account_type": "vpa",
-                        "vpa": {
-                            "address": payment["upiId"]
-                        }
-                    }
-                fund_account = razorpay_post("fund_accounts", fund_payload)
-                fund_account_id = fund_account["id"]
-                fund_account_status = "created"
-                db.users.update_one(
-                    {"userId": user_id},
-                    {"$set": {
-                        fund_account_id_key: fund_account_id,
-                        fund_account_type_key: fund_account_type
-                    }}
-                )
-                logger.info("Fund account created: %s", fund_account_id)
-            except requests.HTTPError as e:
-                logger.exception("Failed to create fund account:")
-                details = e.response.json() if e.response else str(e)
-                return format_response(False, "Failed to create fund account. Please add valid bank or UPI.", {"details": details}, 500)
-        else:
-            logger.info("Fund account fetched from DB: %s", fund_account_id)
-
-        if not RAZORPAYX_ACCOUNT_NO:
-            return format_response(False, "Missing RazorpayX account number in config", None, 500)
-
-        payout_payload = {
-            "account_number": RAZORPAYX_ACCOUNT_NO,
-            "fund_account_id": fund_account_id,
-            "amount": int(amount) * 100,  # rupees to paise
-            "currency": "INR",
-            "mode": "IMPS" if fund_account_type == "bank_account" else "UPI",
-            "purpose": "payout",
-            "queue_if_low_balance": True,
-            "reference_id": f"pay_{user_id[-6:]}_{int(datetime.datetime.utcnow().timestamp())}",
-            "narration": "User Withdrawal"
-        }
+        # Reserve the amount before calling Razorpay, so concurrent withdrawals cannot overdraw.
+        hold_id = f"wd_{ObjectId()}"
+        hold_ttl = PAYOUT_QUEUE_HOLD_TTL_SECONDS if mode == "queue" else WALLET_HOLD_TTL_SECONDS
         try:
-            payout = razorpay_post("payouts", payout_payload)
-        except requests.HTTPError as e:
-            details = e.response.json() if e.response else str(e)
-            logger.exception("Payout failed:")
-            return format_response(False, "Payout failed", {"details": details}, 500)
-
-        # Save payout record to DB.
-        db.payouts.insert_one({
-            "userId": user_id,
-            "payout_id": payout["id"],
-            "amount": payout["amount"] / 100,
-            "status_detail": payout["status"],
-            "fund_account_id": fund_account_id,
-            "fund_account_status": fund_account_status,
-            "fund_account_type": fund_account_type,
-            "created_at": datetime.datetime.utcnow()
-        })
-
-        # Update wallet: subtract withdrawn amount and increment withdrawn field.
-        db.wallet.update_one(
-            {"userId": user_id},
-            {
-                "$inc": {"balance": -float(amount), "withdrawn": float(amount)},
-                "$set": {"updatedAt": datetime.datetime.utcnow()}
-            }
-        )
-        updated_wallet = db.wallet.find_one({"userId": user_id}, {"_id": 0})
+            wallet = reserve_funds(user_id, amount, hold_id, hold_ttl)
+        except WalletNotFound as e:
+            return format_response(False, str(e), None, 404)
+        except InsufficientBalance as e:
+            return format_response(False, str(e), None, 400)
+
+        if mode == "queue":
+            job_id = enqueue_withdrawal(user_id, amount, payment_type, hold_id)
+            return format_response(True, "Withdrawal queued", {
+                "jobId": job_id,
+                "amount": amount,
+                "status": map_status("requested"),
+                "remaining_wallet_balance": wallet.get("balance", 0)
+            }, 202)
+
+        # A timeout or Razorpay server error leaves the outcome unknown; the hold then
+        # expires and the sweeper settles it against Razorpay by reference_id.
+        try:
+            payout, fund_account_id, fund_account_status = create_razorpay_payout(
+                user, payment, payment_type, amount, hold_id
+            )
+        except WithdrawalError as e:
+            if not e.retryable:
+                release_hold(user_id, hold_id)
+            return format_response(False, e.message, e.details, e.status)
+
+        record_payout(user_id, payout, fund_account_id, fund_account_status, payment_type, hold_id)
+        fund_account_type = fund_account_type_for(payment_type)
 
         return format_response(True, "Payout successful", {
             "payout_id": payout["id"],
@@ -197,7 +570,7 @@ def withdraw_funds():
                 "fund_account_type": fund_account_type,
                 "fund_account_status": fund_account_status
             },
-            "remaining_wallet_balance": updated_wallet.get("balance", 0)
+            "remaining_wallet_balance": wallet.get("balance", 0)
         }, 200)
 
     except Exception as e:
@@ -206,6 +579,12 @@ def withdraw_funds():
 
 @payout_bp.route("/status", methods=["GET"])
 def get_all_payouts_status():
+    """
+    GET /payout/status?userId=<user_id>&refresh=0
+
+    Statuses are served from Mongo, kept current by /payout/webhook;
+    refresh=1 also re-fetches them from Razorpay.
+    """
     try:
         user_id = request.args.get("userId")
         if not user_id:
@@ -215,20 +594,9 @@ def get_all_payouts_status():
 
         total_amount = 0
         result = []
+        if request.args.get("refresh") == "1":
+            refresh_payout_statuses(payouts)
         for payout in payouts:
-            # Fetch updated status from Razorpay.
-            try:
-                updated_info = razorpay_get(f"payouts/{payout['payout_id']}")
-                new_status = updated_info.get("status", "")
-                if new_status and new_status.lower() != payout.get("status_detail", "").lower():
-                    db.payouts.update_one(
-                        {"payout_id": payout["payout_id"]},
-                        {"$set": {"status_detail": new_status}}
-                    )
-                    payout["status_detail"] = new_status
-            except Exception as ex:
-                logger.warning("Failed to update status for payout %s: %s", payout['payout_id'], str(ex))
-
             total_amount += payout.get("amount", 0)
             mode = "Bank" if payout.get("fund_account_type") == "bank_account" else "UPI"
             result.append({
@@ -249,8 +617,63 @@ def get_all_payouts_status():
         logger.exception("Error in get_all_payouts_status:")
         return format_response(False, f"Server error: {str(e)}", None, 500)
 
+def _user_name_lookup():
+    return [
+        {"$lookup": {
+            "from": "users",
+            "let": {"userId": "$userId"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$userId", "$$userId"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "name": 1}}
+            ],
+            "as": "user"
+        }},
+        {"$set": {"name": {"$ifNull": [{"$first": "$user.name"}, ""]}}},
+        {"$unset": "user"}
+    ]
+
+def payout_search_stages(searchquery):
+    """
+    Stages, run on db.users, producing the payouts of users whose userId or name
+    contains `searchquery`, each with the user's name attached. Starting from the
+    matching users keeps the payouts lookup on the indexed userId.
+    """
+    pattern = re.escape(searchquery)
+    return [
+        {"$match": {"$or": [
+            {"userId": {"$regex": pattern, "$options": "i"}},
+            {"name": {"$regex": pattern, "$options": "i"}}
+        ]}},
+        {"$project": {"_id": 0, "userId": 1, "name": 1}},
+        {"$lookup": {"from": "payouts", "localField": "userId", "foreignField": "userId", "as": "payout"}},
+        {"$unwind": "$payout"},
+        {"$replaceWith": {"$mergeObjects": ["$payout", {"name": {"$ifNull": ["$name", ""]}}]}}
+    ]
+
+def payout_history_page_stages(page_match, skip, limit, with_names=True):
+    """Stages producing one page of payouts, newest first; `with_names` attaches user names."""
+    stages = [{"$match": page_match}] if page_match else []
+    stages += [{"$sort": {"created_at": -1, "_id": -1}}]
+    if skip:
+        stages.append({"$skip": skip})
+    stages.append({"$limit": limit})
+    return stages + _user_name_lookup() if with_names else stages
+
 @payout_bp.route("/history", methods=["POST"])
 def get_payout_history():
+    """
+    POST /payout/history
+    JSON Body:
+    {
+      "searchquery": "optional userId or name",
+      "per_page": 10,
+      "page": 0,              # offset pagination
+      "cursor": "",           # keyset pagination: send "" for the first page, then next_cursor
+      "include_total": false, # cursor mode only: also return total and total_payout_amount
+      "refresh": false        # optional, re-fetch statuses from Razorpay instead of trusting the webhook
+    }
+    """
     try:
         data = request.get_json() or {}
         try:
@@ -263,53 +686,46 @@ def get_payout_history():
             return format_response(False, "per_page must be an integer.", None, 400)
 
         searchquery = data.get("searchquery", "").strip()
-        filter_query = {}
+        cursor_mode = "cursor" in data
+        try:
+            page_match = keyset_query({}, data.get("cursor"), "created_at") if cursor_mode else {}
+        except InvalidCursor:
+            return format_response(False, "Invalid cursor", None, 400)
+        with_summary = not cursor_mode or bool(data.get("include_total"))
+
+        # A search already attached the user names while finding the payouts.
+        facets = {"page": payout_history_page_stages(
+            page_match, 0 if cursor_mode else page * per_page, per_page, with_names=not searchquery
+        )}
+        if with_summary:
+            facets["summary"] = [{"$group": {"_id": None, "total": {"$sum": 1}, "total_amount": {"$sum": "$amount"}}}]
+        # Total, amount and the page with user names in one round trip.
         if searchquery:
-            matching_users = list(db.users.find(
-                {"$or": [
-                    {"userId": {"$regex": searchquery, "$options": "i"}},
-                    {"name": {"$regex": searchquery, "$options": "i"}}
-                ]},
-                {"userId": 1}
-            ))
-            user_ids = [user["userId"] for user in matching_users]
-            if not user_ids:
-                return format_response(True, "No matching records found.", {
-                    "total": 0, "page": page, "per_page": per_page, "total_payout_amount": 0, "payouts": []
-                }, 200)
-            filter_query["userId"] = {"$in": user_ids}
-
-        total = db.payouts.count_documents(filter_query)
-        agg = list(db.payouts.aggregate([
-            {"$match": filter_query},
-            {"$group": {"_id": None, "total_amount": {"$sum": "$amount"}}}
-        ]))
-        total_amount = agg[0]["total_amount"] if agg else 0
-
-        payouts_cursor = db.payouts.find(filter_query, {"_id": 0}).sort("created_at", -1)\
-            .skip(page * per_page).limit(per_page)
-        payouts_list = list(payouts_cursor)
+            result_doc = next(db.users.aggregate(payout_search_stages(searchquery) + [{"$facet": facets}], allowDiskUse=True), {})
+        else:
+            result_doc = next(db.payouts.aggregate([{"$facet": facets}]), {})
+
+        payouts_list = result_doc.get("page", [])
+        summary = (result_doc.get("summary") or [{}])[0] if with_summary else None
+        total = summary.get("total", 0) if with_summary else None
+        total_amount = summary.get("total_amount", 0) if with_summary else None
+        cursor_out = next_cursor(payouts_list, per_page, "created_at") if cursor_mode else None
+
+        if searchquery and not payouts_list and not total:
+            return format_response(True, "No matching records found.", {
+                "total": 0, "page": page, "per_page": per_page, "next_cursor": None,
+                "total_payout_amount": 0, "payouts": []
+            }, 200)
 
         result = []
+        if data.get("refresh"):
+            refresh_payout_statuses(payouts_list)
         for payout in payouts_list:
-            try:
-                updated_info = razorpay_get(f"payouts/{payout['payout_id']}")
-                new_status = updated_info.get("status", "")
-                if new_status and new_status.lower() != payout.get("status_detail", "").lower():
-                    db.payouts.update_one(
-                        {"payout_id": payout["payout_id"]},
-                        {"$set": {"status_detail": new_status}}
-                    )
-                    payout["status_detail"] = new_status
-            except Exception as ex:
-                logger.warning("Failed to update status for payout %s: %s", payout['payout_id'], str(ex))
             mode = "Bank" if payout.get("fund_account_type") == "bank_account" else "UPI"
-            user = db.users.find_one({"userId": payout.get("userId")}, {"name": 1})
-            name = user.get("name") if user else ""
             result.append({
                 "payout_id": payout.get("payout_id"),
                 "userId": payout.get("userId"),
-                "name": name,
+                "name": payout.get("name") or "",
                 "amount": payout.get("amount", 0),
                 "withdraw_time": payout.get("created_at"),
                 "mode": mode,
@@ -320,6 +736,7 @@ def get_payout_history():
             "total": total,
             "page": page,
             "per_page": per_page,
+            "next_cursor": cursor_out,
             "total_payout_amount": total_amount,
             "payouts": result
         }, 200)
@@ -0,0 +1,239 @@
+import os
+import time
+import socket
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import UpdateOne
+
+from db import db  # Ensure this imports your configured PyMongo instance
+from job_queue import ensure_job_indexes, claim_jobs, complete_job, fail_job, acquire_lease
+from wallet import commit_hold, release_hold, extend_hold
+from payout import (
+    WithdrawalError, razorpay_rate_limiter, create_contact, create_fund_account, create_payout,
+    fund_account_fields, payout_record_update, find_razorpay_payout,
+    refund_if_declined, PAYOUT_REFUND_STATUSES
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PAYOUT_DISPATCH_ENABLED = os.getenv("PAYOUT_DISPATCH_ENABLED", "1") == "1"
+PAYOUT_DISPATCH_BATCH_SIZE = int(os.getenv("PAYOUT_DISPATCH_BATCH_SIZE", "50"))
+PAYOUT_DISPATCH_CONCURRENCY = int(os.getenv("PAYOUT_DISPATCH_CONCURRENCY", "4"))
+PAYOUT_DISPATCH_INTERVAL = float(os.getenv("PAYOUT_DISPATCH_INTERVAL", "2"))
+PAYOUT_DISPATCH_LEASE_SECONDS = int(os.getenv("PAYOUT_DISPATCH_LEASE_SECONDS", "300"))
+# Retries of a withdrawal whose Razorpay outcome is unknown (timeouts, 5xx); the
+# hold id is the payout idempotency key, so retrying cannot pay twice.
+PAYOUT_DISPATCH_MAX_ATTEMPTS = int(os.getenv("PAYOUT_DISPATCH_MAX_ATTEMPTS", "10"))
+# First retry delay, doubled on every attempt (capped by JOB_RETRY_MAX_DELAY).
+PAYOUT_DISPATCH_RETRY_BASE_DELAY = float(os.getenv("PAYOUT_DISPATCH_RETRY_BASE_DELAY", "10"))
+
+# One dispatcher drains db.payout_jobs at a time, so the Razorpay rate is global.
+DISPATCHER_LEASE_ID = "payout_dispatcher"
+
+# Jobs in these states may still create a payout for their hold.
+LIVE_JOB_STATUSES = ["queued", "running"]
+
+dispatch_executor = ThreadPoolExecutor(max_workers=PAYOUT_DISPATCH_CONCURRENCY, thread_name_prefix="payout-dispatch")
+
+
+def ensure_dispatch_indexes():
+    try:
+        db.payout_jobs.create_index("holdId")
+    except Exception as e:
+        logger.error("Error creating payout job index: %s", e)
+
+
+def has_live_job(hold_id):
+    """Whether a queued withdrawal still owns this hold; the expired-hold sweeper leaves those alone."""
+    return db.payout_jobs.find_one({"holdId": hold_id, "status": {"$in": LIVE_JOB_STATUSES}}, {"_id": 1}) is not None
+
+
+def _load_accounts(user_ids):
+    """Users with their payment methods for a batch, in one round trip: {userId: (user, {method: payment})}."""
+    accounts = {}
+    for user in db.users.aggregate([
+        {"$match": {"userId": {"$in": list(user_ids)}}},
+        {"$lookup": {"from": "payment", "localField": "userId", "foreignField": "userId", "as": "payments"}}
+    ]):
+        payments = {payment.get("paymentMethod"): payment for payment in user.pop("payments", [])}
+        accounts[user["userId"]] = (user, payments)
+    return accounts
+
+
+def _rate_limited(fn, *args):
+    razorpay_rate_limiter.acquire(float("inf"))
+    return fn(*args)
+
+
+def _run_stage(calls):
+    """Run {key: (fn, args)} concurrently within the rate limit; returns {key: result or exception}."""
+    futures = {key: dispatch_executor.submit(_rate_limited, fn, *args) for key, (fn, args) in calls.items()}
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            results[key] = e
+    return results
+
+
+def _decline(job, message, details=None):
+    """A definitive failure: return the held funds and show the withdrawal as failed."""
+    release_hold(job["userId"], job["holdId"])
+    db.payouts.update_one(
+        {"hold_id": job["holdId"], "payout_id": None},
+        {"$set": {"status_detail": "failed", "failure_reason": message, "wallet_reversed": True}}
+    )
+    complete_job(db.payout_jobs, job["jobId"], job["workerId"],
+                 {"success": False, "message": message, "details": details})
+
+
+def _retry(job, error):
+    """An unknown outcome: retry after a backoff, and settle against Razorpay once out of attempts."""
+    if job.get("attempts", 0) < PAYOUT_DISPATCH_MAX_ATTEMPTS:
+        fail_job(db.payout_jobs, job, job["workerId"], str(error), PAYOUT_DISPATCH_MAX_ATTEMPTS,
+                 retry_base_delay=PAYOUT_DISPATCH_RETRY_BASE_DELAY)
+        return
+    try:
+        payout = find_razorpay_payout(job["holdId"])
+    except Exception as e:
+        # Left to the expired-hold sweeper.
+        fail_job(db.payout_jobs, job, job["workerId"], f"{error}; lookup failed: {e}", PAYOUT_DISPATCH_MAX_ATTEMPTS)
+        return
+    if payout:
+        db.payouts.update_one(*payout_record_update(
+            job["userId"], payout, payout.get("fund_account_id"), "fetched", job["paymentType"], job["holdId"]
+        ), upsert=True)
+        commit_hold(job["userId"], job["holdId"], payout["id"])
+        refund_if_declined(payout["id"])
+        complete_job(db.payout_jobs, job["jobId"], job["workerId"], {"success": True, "payout_id": payout["id"]})
+    else:
+        _decline(job, f"Payout failed: {error}")
+
+
+def _settle_failure(job, error):
+    if isinstance(error, WithdrawalError) and not error.retryable:
+        _decline(job, error.message, error.details)
+    else:
+        _retry(job, error)
+
+
+def dispatch_batch(worker_id):
+    """
+    Claim up to PAYOUT_DISPATCH_BATCH_SIZE withdrawals and dispatch them in three
+    stages: missing contacts, missing fund accounts, then payouts. Each stage runs
+    its Razorpay calls concurrently under the rate limit and saves its results
+    with one bulk_write. Returns the number of jobs claimed.
+    """
+    jobs = claim_jobs(db.payout_jobs, worker_id, PAYOUT_DISPATCH_LEASE_SECONDS, PAYOUT_DISPATCH_BATCH_SIZE)
+    if not jobs:
+        return 0
+    accounts = _load_accounts({job["userId"] for job in jobs})
+
+    active = []
+    for job in jobs:
+        user, payments = accounts.get(job["userId"], (None, {}))
+        # Claim the hold for the length of this dispatch; if it is gone the withdrawal
+        # was already settled (refunded) and must not be paid out.
+        if not extend_hold(job["userId"], job["holdId"], PAYOUT_DISPATCH_LEASE_SECONDS):
+            complete_job(db.payout_jobs, job["jobId"], job["workerId"], {"success": False, "message": "Withdrawal expired"})
+        elif not user:
+            _decline(job, "User not found")
+        elif job["paymentType"] not in payments:
+            _decline(job, "No payment method found for selected type.")
+        else:
+            active.append((job, user, payments[job["paymentType"]]))
+
+    # Stage 1: contacts, once per user.
+    contact_calls = {
+        user["userId"]: (create_contact, (user,))
+        for job, user, payment in active if not user.get("razorpay_contact_id")
+    }
+    contacts = _run_stage(contact_calls)
+    user_updates = [
+        UpdateOne({"userId": user_id}, {"$set": {"razorpay_contact_id": result}})
+        for user_id, result in contacts.items() if not isinstance(result, Exception)
+    ]
+    for job, user, payment in active:
+        if not isinstance(contacts.get(user["userId"]), Exception) and user["userId"] in contacts:
+            user["razorpay_contact_id"] = contacts[user["userId"]]
+
+    # Stage 2: fund accounts, once per user and payment type.
+    fund_calls = {}
+    for job, user, payment in active:
+        key = (user["userId"], job["paymentType"])
+        if user.get("razorpay_contact_id") and not user.get(f"razorpay_fund_account_id_{job['paymentType']}"):
+            fund_calls[key] = (create_fund_account, (user["razorpay_contact_id"], payment, job["paymentType"]))
+    fund_accounts = _run_stage(fund_calls)
+    for (user_id, payment_type), result in fund_accounts.items():
+        if not isinstance(result, Exception):
+            user_updates.append(UpdateOne({"userId": user_id}, {"$set": fund_account_fields(payment_type, result)}))
+    if user_updates:
+        db.users.bulk_write(user_updates, ordered=False)
+
+    # Stage 3: payouts.
+    payout_calls, fund_account_info = {}, {}
+    for job, user, payment in active:
+        key = (user["userId"], job["paymentType"])
+        error = contacts.get(user["userId"]) if isinstance(contacts.get(user["userId"]), Exception) else None
+        if error is None and isinstance(fund_accounts.get(key), Exception):
+            error = fund_accounts[key]
+        if error is not None:
+            _settle_failure(job, error)
+            continue
+        if key in fund_accounts:
+            fund_account_info[job["jobId"]] = (fund_accounts[key], "created")
+        else:
+            fund_account_info[job["jobId"]] = (user[f"razorpay_fund_account_id_{job['paymentType']}"], "fetched")
+        payout_calls[job["jobId"]] = (
+            create_payout, (fund_account_info[job["jobId"]][0], job["paymentType"], job["amount"], job["holdId"])
+        )
+    payouts = _run_stage(payout_calls)
+
+    payout_updates, created = [], []
+    for job, user, payment in active:
+        if job["jobId"] not in payouts:
+            continue
+        result = payouts[job["jobId"]]
+        if isinstance(result, Exception):
+            _settle_failure(job, result)
+            continue
+        fund_account_id, fund_account_status = fund_account_info[job["jobId"]]
+        payout_updates.append(UpdateOne(*payout_record_update(
+            job["userId"], result, fund_account_id, fund_account_status, job["paymentType"], job["holdId"]
+        ), upsert=True))
+        created.append((job, result))
+    if payout_updates:
+        db.payouts.bulk_write(payout_updates, ordered=False)
+    for job, payout in created:
+        commit_hold(job["userId"], job["holdId"], payout["id"])
+        if (payout.get("status") or "").lower() in PAYOUT_REFUND_STATUSES:
+            refund_if_declined(payout["id"])
+        complete_job(db.payout_jobs, job["jobId"], job["workerId"], {"success": True, "payout_id": payout["id"]})
+    return len(jobs)
+
+
+def _dispatch_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        claimed = 0
+        try:
+            if acquire_lease(db.meta, DISPATCHER_LEASE_ID, owner, PAYOUT_DISPATCH_LEASE_SECONDS):
+                claimed = dispatch_batch(owner)
+        except Exception as e:
+            logger.error("Error dispatching payouts: %s", e)
+        # Full batches are followed straight away; the rate limiter sets the pace.
+        if claimed < PAYOUT_DISPATCH_BATCH_SIZE:
+            time.sleep(PAYOUT_DISPATCH_INTERVAL)
+
+
+def start_payout_dispatcher():
+    """Drain queued withdrawals in the background."""
+    ensure_job_indexes(db.payout_jobs)
+    ensure_dispatch_indexes()
+    if PAYOUT_DISPATCH_ENABLED:
+        threading.Thread(target=_dispatch_loop, name="payout-dispatcher", daemon=True).start()
@@ -0,0 +1,155 @@
+import os
+import time
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from db import db  # Ensure this imports your configured PyMongo instance
+from job_queue import acquire_lease
+from wallet import expired_holds, commit_hold, release_hold
+from payout_dispatch import has_live_job
+from payout import (
+    PAYOUT_STATUS_RANK, PAYOUT_REFUND_STATUSES, map_status, razorpay_get,
+    razorpay_rate_limiter, apply_payout_status, refund_if_declined,
+    find_razorpay_payout, record_payout
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PAYOUT_RECONCILE_ENABLED = os.getenv("PAYOUT_RECONCILE_ENABLED", "1") == "1"
+PAYOUT_RECONCILE_INTERVAL = float(os.getenv("PAYOUT_RECONCILE_INTERVAL", "60"))
+PAYOUT_RECONCILE_BATCH_SIZE = int(os.getenv("PAYOUT_RECONCILE_BATCH_SIZE", "50"))
+# A payout whose status did not change is checked again after a delay that doubles
+# with every unchanged check, from the base up to the cap.
+PAYOUT_RECONCILE_BASE_DELAY = float(os.getenv("PAYOUT_RECONCILE_BASE_DELAY", "60"))
+PAYOUT_RECONCILE_MAX_DELAY = float(os.getenv("PAYOUT_RECONCILE_MAX_DELAY", str(6 * 3600)))
+
+# Statuses still in flight: those map_status reports as Pending or Processing.
+OPEN_PAYOUT_STATUSES = [status for status in PAYOUT_STATUS_RANK if map_status(status) in ("Pending", "Processing")]
+
+# Only one process reconciles at a time; it holds this lease in db.meta.
+RECONCILER_LEASE_ID = "payout_reconciler"
+
+
+def ensure_reconciler_indexes():
+    try:
+        db.payouts.create_index([("status_detail", 1), ("next_check_at", 1)])
+    except Exception as e:
+        logger.error("Error creating payout reconciler index: %s", e)
+
+
+def _backoff_seconds(checks):
+    return min(PAYOUT_RECONCILE_MAX_DELAY, PAYOUT_RECONCILE_BASE_DELAY * (2 ** min(checks, 20)))
+
+
+def reconcile_batch(limit=PAYOUT_RECONCILE_BATCH_SIZE):
+    """
+    Refresh up to `limit` open payouts that are due, oldest check first.
+    Returns (checked, changed).
+    """
+    now = datetime.utcnow()
+    payouts = list(db.payouts.find(
+        {
+            "status_detail": {"$in": OPEN_PAYOUT_STATUSES},
+            "$or": [{"next_check_at": {"$lte": now}}, {"next_check_at": {"$exists": False}}]
+        },
+        {"payout_id": 1, "status_detail": 1, "reconcile_checks": 1}
+    ).sort("next_check_at", 1).limit(limit))
+
+    schedule, changed = [], 0
+    for payout in payouts:
+        payout_id = payout.get("payout_id")
+        checks = payout.get("reconcile_checks", 0)
+        try:
+            razorpay_rate_limiter.acquire(float("inf"))
+            new_status = (razorpay_get(f"payouts/{payout_id}").get("status") or "").lower()
+        except Exception as e:
+            logger.warning("Reconciler failed to fetch payout %s: %s", payout_id, e)
+            new_status = None
+        if new_status and new_status != (payout.get("status_detail") or "").lower():
+            if apply_payout_status(payout_id, new_status, "reconciler") is not None:
+                changed += 1
+            if new_status in PAYOUT_REFUND_STATUSES:
+                refund_if_declined(payout_id)
+            checks = 0
+        else:
+            checks += 1
+        schedule.append(UpdateOne({"_id": payout["_id"]}, {"$set": {
+            "reconcile_checks": checks,
+            "next_check_at": datetime.utcnow() + timedelta(seconds=_backoff_seconds(checks))
+        }}))
+    if schedule:
+        db.payouts.bulk_write(schedule, ordered=False)
+    return len(payouts), changed
+
+
+def settle_expired_holds():
+    """
+    Settle withdrawal holds left open by requests that died mid-way: commit the
+    hold if Razorpay has a payout for it, otherwise return it to the balance.
+    Holds of queued withdrawals are left to the dispatcher until their job ends.
+    Returns (committed, released).
+    """
+    committed = released = 0
+    for user_id, hold in expired_holds():
+        hold_id = hold["holdId"]
+        try:
+            if has_live_job(hold_id):
+                continue
+            existing = db.payouts.find_one({"hold_id": hold_id}, {"payout_id": 1})
+            if existing and existing.get("payout_id"):
+                committed += commit_hold(user_id, hold_id, existing["payout_id"])
+                refund_if_declined(existing["payout_id"])
+                continue
+            razorpay_rate_limiter.acquire(float("inf"))
+            payout = find_razorpay_payout(hold_id)
+        except Exception as e:
+            logger.warning("Could not settle hold %s yet: %s", hold_id, e)
+            continue
+        if payout:
+            payment_type = 0 if payout.get("mode") == "UPI" else 1
+            record_payout(user_id, payout, payout.get("fund_account_id"), "fetched", payment_type, hold_id)
+            committed += 1
+        else:
+            released += release_hold(user_id, hold_id)
+            # A queued withdrawal that never reached Razorpay shows as failed, already refunded.
+            db.payouts.update_one(
+                {"hold_id": hold_id, "payout_id": None},
+                {"$set": {"status_detail": "failed", "failure_reason": "Withdrawal expired", "wallet_reversed": True}}
+            )
+    if committed or released:
+        logger.info("Settled expired holds: %s committed, %s released", committed, released)
+    return committed, released
+
+
+def _reconcile_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            if acquire_lease(db.meta, RECONCILER_LEASE_ID, owner, PAYOUT_RECONCILE_INTERVAL * 2):
+                checked, changed = reconcile_batch()
+                # Keep draining while whole batches come back due.
+                while checked == PAYOUT_RECONCILE_BATCH_SIZE and \
+                        acquire_lease(db.meta, RECONCILER_LEASE_ID, owner, PAYOUT_RECONCILE_INTERVAL * 2):
+                    checked, more = reconcile_batch()
+                    changed += more
+                if changed:
+                    logger.info("Payout reconciler updated %s payouts", changed)
+                settle_expired_holds()
+        except Exception as e:
+            logger.error("Error reconciling payouts: %s", e)
+        time.sleep(PAYOUT_RECONCILE_INTERVAL)
+
+
+def start_payout_reconciler():
+    """
+    Periodically refresh in-flight payouts from Razorpay, as a fallback to the
+    webhook, and settle expired withdrawal holds.
+    """
+    if PAYOUT_RECONCILE_ENABLED:
+        threading.Thread(target=_reconcile_loop, name="payout-reconciler", daemon=True).start()
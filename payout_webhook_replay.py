@@ -0,0 +1,82 @@
+"""
+Replay recorded Razorpay payout webhook events through /payout/webhook.
+
+Each line of the input file is one recorded delivery: either the raw event
+JSON, or {"event_id": "...", "body": {...event...}}. Bodies are re-signed with
+RAZORPAY_WEBHOOK_SECRET, so recordings from any environment can be replayed.
+
+    python payout_webhook_replay.py events.jsonl                  # in-process, no server needed
+    python payout_webhook_replay.py events.jsonl --url http://localhost:5000/payout/webhook
+    python payout_webhook_replay.py events.jsonl --repeat 2       # check redeliveries are no-ops
+"""
+import sys
+import json
+import hmac
+import hashlib
+import argparse
+
+import requests
+from flask import Flask
+
+import payout
+from payout import payout_bp
+
+
+def load_deliveries(path):
+    with open(path, "r", encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "body" in record:
+                body, event_id = record["body"], record.get("event_id")
+            else:
+                body, event_id = record, record.get("id")
+            yield line_number, event_id or f"replay_{line_number}", json.dumps(body).encode("utf-8")
+
+
+def sign(body, secret):
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Razorpay payout webhook events.")
+    parser.add_argument("path", help="JSON lines file of recorded events")
+    parser.add_argument("--url", help="webhook URL; without it events go through an in-process test client")
+    parser.add_argument("--secret", default=payout.RAZORPAY_WEBHOOK_SECRET, help="defaults to RAZORPAY_WEBHOOK_SECRET")
+    parser.add_argument("--repeat", type=int, default=1, help="deliver every event this many times")
+    args = parser.parse_args()
+    if not args.secret:
+        parser.error("a webhook secret is required (--secret or RAZORPAY_WEBHOOK_SECRET)")
+
+    client = None
+    if not args.url:
+        # Only the payout blueprint, so no background workers are started.
+        payout.RAZORPAY_WEBHOOK_SECRET = args.secret
+        app = Flask(__name__)
+        app.register_blueprint(payout_bp)
+        client = app.test_client()
+
+    failures = 0
+    for line_number, event_id, body in load_deliveries(args.path):
+        headers = {
+            "Content-Type": "application/json",
+            "X-Razorpay-Signature": sign(body, args.secret),
+            "X-Razorpay-Event-Id": event_id
+        }
+        for attempt in range(args.repeat):
+            if client:
+                response = client.post("/payout/webhook", data=body, headers=headers)
+                status, result = response.status_code, response.get_json()
+            else:
+                response = requests.post(args.url, data=body, headers=headers, timeout=30)
+                status, result = response.status_code, response.json()
+            if status != 200:
+                failures += 1
+            print(f"line {line_number} delivery {attempt + 1}: {status} {result.get('message')} {result.get('data')}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
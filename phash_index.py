@@ -0,0 +1,158 @@
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Records written by other worker processes are picked up by re-reading a short
+# window behind the newest verifiedAt already indexed. Re-adding a known hash is a no-op.
+CATCH_UP_OVERLAP = timedelta(seconds=60)
+
+
+def phash_to_int(phash_hex):
+    """Convert a 64-bit pHash hex string (as produced by str(imagehash.phash(...))) to an int."""
+    return int(phash_hex, 16)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer pHashes using Hamming distance.
+    Each node is [hash, set_of_user_ids, {distance: child_node}].
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, user_id):
+        if self.root is None:
+            self.root = [value, {user_id}, {}]
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].add(user_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {user_id}, {}]
+                self.size += 1
+                return
+            node = child
+
+    def has_match_from_other_user(self, value, threshold, user_id):
+        """Return True if a hash within `threshold` bits was submitted by a user other than `user_id`."""
+        if self.root is None:
+            return False
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= threshold and (len(node[1]) > 1 or user_id not in node[1]):
+                return True
+            low, high = distance - threshold, distance + threshold
+            for edge, child in node[2].items():
+                if low <= edge <= high:
+                    stack.append(child)
+        return False
+
+
+class PhashIndex:
+    """Per-task BK-trees of verified screenshot hashes, kept in sync with db.task_history."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trees = {}
+        self._watermarks = {}
+
+    def _add_locked(self, task_id, user_id, phash_hex, verified_at=None):
+        try:
+            value = phash_to_int(phash_hex)
+        except (TypeError, ValueError):
+            logger.warning("Skipping invalid pHash %r for task %s", phash_hex, task_id)
+            return
+        tree = self._trees.get(task_id)
+        if tree is None:
+            tree = self._trees[task_id] = BKTree()
+        tree.add(value, user_id)
+        if verified_at is not None:
+            current = self._watermarks.get(task_id)
+            if current is None or verified_at > current:
+                self._watermarks[task_id] = verified_at
+
+    def add(self, task_id, user_id, phash_hex, verified_at=None):
+        """Index a newly verified submission."""
+        with self._lock:
+            self._add_locked(task_id, user_id, phash_hex, verified_at or datetime.utcnow())
+
+    def rebuild(self):
+        """Rebuild every task's tree from db.task_history."""
+        trees_before = self._trees
+        with self._lock:
+            self._trees = {}
+            self._watermarks = {}
+            cursor = db.task_history.find(
+                {"verified": True, "image_phash": {"$exists": True, "$ne": None}},
+                {"_id": 0, "taskId": 1, "userId": 1, "image_phash": 1, "verifiedAt": 1}
+            )
+            count = 0
+            for record in cursor:
+                self._add_locked(record.get("taskId"), record.get("userId"),
+                                 record.get("image_phash"), record.get("verifiedAt"))
+                count += 1
+        logger.info("pHash index rebuilt: %s records across %s tasks (was %s tasks)",
+                    count, len(self._trees), len(trees_before))
+
+    def _catch_up(self, task_id):
+        """Pull records for `task_id` written since the last sync (possibly by another process)."""
+        with self._lock:
+            watermark = self._watermarks.get(task_id)
+        query = {"taskId": task_id, "verified": True}
+        if watermark is not None:
+            query["verifiedAt"] = {"$gte": watermark - CATCH_UP_OVERLAP}
+        records = db.task_history.find(
+            query, {"_id": 0, "userId": 1, "image_phash": 1, "verifiedAt": 1}
+        )
+        with self._lock:
+            for record in records:
+                if record.get("image_phash"):
+                    self._add_locked(task_id, record.get("userId"),
+                                     record["image_phash"], record.get("verifiedAt"))
+
+    def is_duplicate(self, phash_hex, task_id, user_id, threshold=5):
+        self._catch_up(task_id)
+        value = phash_to_int(phash_hex)
+        with self._lock:
+            tree = self._trees.get(task_id)
+            if tree is None:
+                return False
+            return tree.has_match_from_other_user(value, threshold, user_id)
+
+
+def ensure_phash_indexes():
+    """Index used by the per-task catch-up query."""
+    try:
+        db.task_history.create_index([("taskId", 1), ("verified", 1), ("verifiedAt", 1)])
+    except Exception as e:
+        logger.error("Error creating task_history pHash index: %s", e)
+
+
+def load_phash_index():
+    """Build the in-process index from db.task_history; called once at startup."""
+    try:
+        phash_index.rebuild()
+    except Exception as e:
+        logger.error("Error rebuilding pHash index: %s", e)
+
+
+phash_index = PhashIndex()
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import logging
+
+import numpy as np
+from flask import Blueprint, request
+
+from db import db  # Ensure this imports your configured PyMongo instance
+from utils import format_response  # Centralized response formatter
+
+phash_bp = Blueprint("phash", __name__, url_prefix="/admin/phash")
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PHASH_STORE_MAX_AGE_SECONDS = float(os.getenv("PHASH_STORE_MAX_AGE_SECONDS", "300"))
+# Upper bound on the scratch memory of one Hamming distance block.
+PHASH_STORE_BLOCK_BYTES = int(os.getenv("PHASH_STORE_BLOCK_BYTES", str(64 * 1024 * 1024)))
+# near_pairs splits the hash into threshold+1 chunks; beyond 8 the chunks are so
+# narrow that each bucket holds a large share of the store.
+MAX_CLUSTER_THRESHOLD = 8
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values):
+    """Vectorized popcount of a uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    as_bytes = np.ascontiguousarray(values).view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def _block_rows(columns):
+    """Rows per distance block so that a block against `columns` hashes stays within PHASH_STORE_BLOCK_BYTES."""
+    # The XOR matrix takes 8 bytes per cell and the popcount up to another 8.
+    return max(1, PHASH_STORE_BLOCK_BYTES // (16 * max(1, columns)))
+
+
+def _chunk_layout(threshold):
+    """
+    Split 64 bits into threshold+1 disjoint chunks. Two hashes within `threshold`
+    bits of each other are then identical on at least one chunk (pigeonhole).
+    Returns a list of (shift, mask).
+    """
+    parts = threshold + 1
+    widths = [64 // parts + (1 if i < 64 % parts else 0) for i in range(parts)]
+    layout, shift = [], 0
+    for width in widths:
+        layout.append((np.uint64(shift), np.uint64((1 << width) - 1)))
+        shift += width
+    return layout
+
+
+def _merge_labels(labels, a, b):
+    """Connected components by vectorized label propagation over the edge list (a, b)."""
+    while True:
+        m = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, m)
+        np.minimum.at(labels, b, m)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            return labels
+
+
+class PhashStore:
+    """
+    Compact snapshot of every verified screenshot hash: a uint64 array of pHashes
+    with parallel int32 arrays indexing into the userId and taskId lists.
+    """
+
+    def __init__(self, hashes, user_idx, task_idx, users, tasks):
+        self.hashes = hashes
+        self.user_idx = user_idx
+        self.task_idx = task_idx
+        self.users = users
+        self.tasks = tasks
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls):
+        hashes, user_idx, task_idx = [], [], []
+        users, tasks = {}, {}
+        cursor = db.task_history.find(
+            {"verified": True, "image_phash": {"$exists": True, "$ne": None}},
+            {"_id": 0, "userId": 1, "taskId": 1, "image_phash": 1}
+        ).batch_size(10000)
+        for record in cursor:
+            try:
+                value = int(record["image_phash"], 16)
+            except (TypeError, ValueError):
+                continue
+            hashes.append(value)
+            user_idx.append(users.setdefault(record.get("userId"), len(users)))
+            task_idx.append(tasks.setdefault(record.get("taskId"), len(tasks)))
+        return cls(
+            np.array(hashes, dtype=np.uint64),
+            np.array(user_idx, dtype=np.int32),
+            np.array(task_idx, dtype=np.int32),
+            list(users),
+            list(tasks)
+        )
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def query(self, phashes, threshold=5):
+        """
+        Batch Hamming query. Returns, for each query hash, the indices of stored
+        hashes within `threshold` bits.
+        """
+        queries = np.array([int(h, 16) if isinstance(h, str) else int(h) for h in phashes], dtype=np.uint64)
+        matches = []
+        block_size = _block_rows(len(self.hashes))
+        for start in range(0, len(queries), block_size):
+            block = queries[start:start + block_size]
+            distances = popcount64(block[:, None] ^ self.hashes[None, :])
+            for row in distances:
+                matches.append(np.nonzero(row <= threshold)[0])
+        return matches
+
+    def near_pairs(self, threshold=5):
+        """All index pairs (i < j) whose hashes are within `threshold` bits, as two arrays."""
+        firsts, seconds = [], []
+        for shift, mask in _chunk_layout(threshold):
+            keys = (self.hashes >> shift) & mask
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(sorted_keys)]))
+            for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+                members = order[start:end]
+                group = self.hashes[members]
+                # Compare each block of rows with itself and the rows after it.
+                block_size = _block_rows(len(group))
+                for row in range(0, len(group), block_size):
+                    distances = popcount64(group[row:row + block_size, None] ^ group[None, row:])
+                    i, j = np.nonzero(np.triu(distances <= threshold, k=1))
+                    firsts.append(members[row + i])
+                    seconds.append(members[row + j])
+        if not firsts:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        a, b = np.concatenate(firsts), np.concatenate(seconds)
+        # A pair can share several chunks; normalise the order and drop repeats.
+        pairs = np.unique(np.stack((np.minimum(a, b), np.maximum(a, b)), axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def find_clusters(self, threshold=5, cross_user_only=True, limit=100):
+        """
+        Group near-identical screenshots across the whole history. With
+        `cross_user_only`, only clusters submitted by two or more users are reported.
+        """
+        if len(self) < 2:
+            return []
+        a, b = self.near_pairs(threshold)
+        if cross_user_only:
+            keep = self.user_idx[a] != self.user_idx[b]
+            a, b = a[keep], b[keep]
+        if len(a) == 0:
+            return []
+        labels = _merge_labels(np.arange(len(self), dtype=np.int64), a, b)
+        members = np.unique(np.concatenate((a, b)))
+        member_labels = labels[members]
+        clusters = []
+        for label in np.unique(member_labels):
+            indices = members[member_labels == label]
+            user_set = {self.users[u] for u in self.user_idx[indices]}
+            task_set = {self.tasks[t] for t in self.task_idx[indices]}
+            clusters.append({
+                "size": int(len(indices)),
+                "distinct_users": len(user_set),
+                "distinct_tasks": len(task_set),
+                "members": [
+                    {
+                        "userId": self.users[self.user_idx[i]],
+                        "taskId": self.tasks[self.task_idx[i]],
+                        "image_phash": format(int(self.hashes[i]), "016x")
+                    }
+                    for i in indices
+                ]
+            })
+        clusters.sort(key=lambda c: (c["distinct_users"], c["size"]), reverse=True)
+        return clusters[:limit]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_phash_store(refresh=False):
+    """Return the shared store, reloading it when older than PHASH_STORE_MAX_AGE_SECONDS."""
+    global _store
+    with _store_lock:
+        if refresh or _store is None or time.time() - _store.loaded_at > PHASH_STORE_MAX_AGE_SECONDS:
+            _store = PhashStore.load()
+            logger.info("Loaded pHash store with %s hashes", len(_store))
+        return _store
+
+
+@phash_bp.route("/clusters", methods=["POST"])
+def get_duplicate_clusters():
+    """
+    POST /admin/phash/clusters
+    JSON Body:
+    {
+      "threshold": 5,            # optional, max Hamming distance (0-8)
+      "cross_user_only": true,   # optional, only clusters spanning several users
+      "limit": 100,              # optional
+      "refresh": false           # optional, reload hashes from task_history first
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            threshold = int(data.get("threshold", 5))
+            limit = int(data.get("limit", 100))
+        except (TypeError, ValueError):
+            return format_response(False, "threshold and limit must be integers", None, 400)
+        if threshold < 0 or threshold > MAX_CLUSTER_THRESHOLD:
+            return format_response(False, f"threshold must be between 0 and {MAX_CLUSTER_THRESHOLD}", None, 400)
+        started = time.time()
+        store = get_phash_store(refresh=bool(data.get("refresh", False)))
+        clusters = store.find_clusters(threshold, bool(data.get("cross_user_only", True)), limit)
+        return format_response(True, "Duplicate clusters retrieved successfully", {
+            "total_hashes": len(store),
+            "threshold": threshold,
+            "elapsed_seconds": round(time.time() - started, 3),
+            "clusters": clusters
+        }, 200)
+    except Exception as e:
+        logger.exception("Error finding duplicate clusters:")
+        return format_response(False, f"Server error: {str(e)}", None, 500)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report clusters of near-identical screenshots in task_history.")
+    parser.add_argument("--threshold", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--all", action="store_true", help="include clusters submitted by a single user")
+    args = parser.parse_args()
+    started = time.time()
+    store = PhashStore.load()
+    clusters = store.find_clusters(args.threshold, not args.all, args.limit)
+    json.dump({
+        "total_hashes": len(store),
+        "elapsed_seconds": round(time.time() - started, 3),
+        "clusters": clusters
+    }, sys.stdout, indent=2)
+    print()
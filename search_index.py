@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import json
+import base64
+import argparse
+import threading
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MIN_PREFIX_LENGTH = 2
+MAX_TOKEN_LENGTH = 20
+MIN_DIGIT_SUFFIX_LENGTH = 4
+MAX_SEARCH_TERMS = 8
+# Ranking only considers the newest matches, read in index order, so a broad
+# prefix never sorts the whole collection; totals are capped at the same number.
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Searchable fields per indexed collection: kind -> (collection, key field, fields)
+SEARCH_SOURCES = {
+    "task": ("tasks", "taskId", ("title", "description", "message")),
+    "user": ("users", "userId", ("name", "email", "phone"))
+}
+
+# db.search_index holds one entry per indexed document, keeping the tokens out of
+# the documents themselves:
+#   {_id: "<kind>:<key>", kind, key, tokens: [prefixes...], words: [whole words...], createdAt}
+
+
+class InvalidSearchCursor(ValueError):
+    """Raised when a search cursor cannot be decoded."""
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric words of `text`, each capped at MAX_TOKEN_LENGTH."""
+    return [word[:MAX_TOKEN_LENGTH] for word in re.findall(r"[a-z0-9]+", str(text or "").lower())]
+
+
+def index_tokens(values):
+    """
+    Tokens stored for a document: every prefix (from MIN_PREFIX_LENGTH) of every
+    word, plus trailing digits of numbers so phone numbers match on their last digits.
+    Returns (tokens, words).
+    """
+    words, tokens = set(), set()
+    for value in values:
+        for word in tokenize(value):
+            words.add(word)
+            tokens.add(word)
+            for length in range(MIN_PREFIX_LENGTH, len(word)):
+                tokens.add(word[:length])
+            if word.isdigit():
+                for length in range(MIN_DIGIT_SUFFIX_LENGTH, len(word)):
+                    tokens.add(word[-length:])
+    return sorted(tokens), sorted(words)
+
+
+def ensure_search_indexes():
+    try:
+        db.search_index.create_index([("kind", 1), ("tokens", 1), ("createdAt", -1), ("_id", -1)])
+    except Exception as e:
+        logger.error("Error creating search index: %s", e)
+
+
+def _entry(kind, doc):
+    _, key_field, fields = SEARCH_SOURCES[kind]
+    tokens, words = index_tokens(doc.get(field) for field in fields)
+    key = doc[key_field]
+    return {
+        "_id": f"{kind}:{key}",
+        "kind": kind,
+        "key": key,
+        "tokens": tokens,
+        "words": words,
+        "createdAt": doc.get("createdAt") or datetime.utcnow()
+    }
+
+
+def index_document(kind, doc):
+    """Add or refresh the search entry for a task or user document."""
+    try:
+        entry = _entry(kind, doc)
+        db.search_index.replace_one({"_id": entry["_id"]}, entry, upsert=True)
+    except Exception as e:
+        logger.error("Error indexing %s for search: %s", kind, e)
+
+
+def reindex(kind, key):
+    """Re-read a document by key and refresh its search entry."""
+    collection, key_field, fields = SEARCH_SOURCES[kind]
+    projection = {field: 1 for field in fields + (key_field, "createdAt")}
+    doc = db[collection].find_one({key_field: key}, projection)
+    if doc:
+        index_document(kind, doc)
+
+
+def remove_document(kind, key):
+    try:
+        db.search_index.delete_one({"_id": f"{kind}:{key}"})
+    except Exception as e:
+        logger.error("Error removing %s %s from search: %s", kind, key, e)
+
+
+def rebuild_search_index(kind, batch_size=1000):
+    """Index every document of a kind in bulk. Returns the number indexed."""
+    collection, key_field, fields = SEARCH_SOURCES[kind]
+    projection = {field: 1 for field in fields + (key_field, "createdAt")}
+    operations, count = [], 0
+    for doc in db[collection].find({key_field: {"$exists": True}}, projection).batch_size(batch_size):
+        entry = _entry(kind, doc)
+        operations.append(UpdateOne({"_id": entry["_id"]}, {"$set": entry}, upsert=True))
+        if len(operations) >= batch_size:
+            db.search_index.bulk_write(operations, ordered=False)
+            count += len(operations)
+            operations = []
+    if operations:
+        db.search_index.bulk_write(operations, ordered=False)
+        count += len(operations)
+    return count
+
+
+def _backfill_missing():
+    for kind, (collection, _, _) in SEARCH_SOURCES.items():
+        try:
+            if db.search_index.count_documents({"kind": kind}) < db[collection].estimated_document_count():
+                logger.info("Backfilled %s %s search entries", rebuild_search_index(kind), kind)
+        except Exception as e:
+            logger.error("Error backfilling %s search entries: %s", kind, e)
+
+
+def start_search_backfill():
+    """Index documents written before search was introduced, in the background."""
+    threading.Thread(target=_backfill_missing, name="search-backfill", daemon=True).start()
+
+
+def encode_search_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))["o"])
+    except Exception:
+        raise InvalidSearchCursor("Invalid cursor")
+    if offset < 0:
+        raise InvalidSearchCursor("Invalid cursor")
+    return offset
+
+
+def search(kind, keyword, skip, limit, with_total=True):
+    """
+    Ranked keyword search. Every term of `keyword` must prefix-match a word of the
+    document; the newest SEARCH_MAX_CANDIDATES matches rank by how many terms match
+    whole words, then newest first. Returns (keys, total); total counts at most
+    SEARCH_MAX_CANDIDATES and is None when not requested. Input is matched
+    literally, never as a regex.
+    """
+    terms = list(dict.fromkeys(tokenize(keyword)))
+    # Single characters are only indexed as whole words, so drop them when longer terms exist.
+    terms = ([term for term in terms if len(term) >= MIN_PREFIX_LENGTH] or terms)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return [], 0
+    # The longest term is usually the most selective; lead with it so the index scan uses it.
+    match = {"kind": kind, "tokens": {"$all": sorted(terms, key=len, reverse=True)}}
+    entries = db.search_index.aggregate([
+        {"$match": match},
+        {"$sort": {"createdAt": -1, "_id": -1}},
+        {"$limit": SEARCH_MAX_CANDIDATES},
+        {"$project": {"key": 1, "createdAt": 1, "score": {"$size": {"$setIntersection": ["$words", terms]}}}},
+        {"$sort": {"score": -1, "createdAt": -1, "_id": -1}},
+        {"$skip": skip},
+        {"$limit": limit}
+    ])
+    keys = [entry["key"] for entry in entries]
+    total = db.search_index.count_documents(match, limit=SEARCH_MAX_CANDIDATES) if with_total else None
+    return keys, total
+
+
+def fetch_in_order(collection, key_field, keys, projection):
+    """Fetch documents by key with one $in query, preserving the order of `keys`."""
+    docs = {doc[key_field]: doc for doc in collection.find({key_field: {"$in": keys}}, projection)}
+    return [docs[key] for key in keys if key in docs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the admin keyword search index.")
+    parser.add_argument("kinds", nargs="*", default=list(SEARCH_SOURCES), choices=list(SEARCH_SOURCES))
+    args = parser.parse_args()
+    for kind in args.kinds:
+        print(f"{kind}: {rebuild_search_index(kind)} documents indexed", file=sys.stdout)
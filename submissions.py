@@ -0,0 +1,61 @@
+import logging
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SUBMISSION_STATUSES = ("pending", "accepted", "rejected")
+
+
+def ensure_submission_indexes():
+    try:
+        db.submissions.create_index([("taskId", 1), ("userId", 1)], unique=True)
+        db.submissions.create_index([("status", 1), ("updatedAt", -1)])
+        db.submissions.create_index([("userId", 1), ("updatedAt", -1)])
+    except Exception as e:
+        logger.error("Error creating submissions indexes: %s", e)
+
+
+def set_submission_status(task_id, user_id, status, verification_details=None, session=None):
+    """
+    Record a user's verification state for a task in db.submissions and keep the
+    per-task counters in db.task_stats in step. The shared task document is not touched.
+    """
+    now = datetime.utcnow()
+    update_fields = {"status": status, "updatedAt": now}
+    if verification_details is not None:
+        update_fields["verification_details"] = verification_details
+    previous = db.submissions.find_one_and_update(
+        {"taskId": task_id, "userId": user_id},
+        {"$set": update_fields, "$setOnInsert": {"createdAt": now}},
+        projection={"status": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    previous_status = previous.get("status") if previous else None
+    if previous_status == status:
+        return
+    increments = {f"counts.{status}": 1}
+    if previous_status in SUBMISSION_STATUSES:
+        increments[f"counts.{previous_status}"] = -1
+    db.task_stats.update_one(
+        {"_id": task_id},
+        {"$inc": increments, "$set": {"updatedAt": now}},
+        upsert=True,
+        session=session
+    )
+
+
+def get_submission_counts(task_ids):
+    """Return {taskId: {"pending": n, "accepted": n, "rejected": n}} in one query."""
+    counts = {task_id: {status: 0 for status in SUBMISSION_STATUSES} for task_id in task_ids}
+    for stats in db.task_stats.find({"_id": {"$in": list(task_ids)}}, {"counts": 1}):
+        for status, value in (stats.get("counts") or {}).items():
+            counts[stats["_id"]][status] = value
+    return counts
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+import logging
+
+from pymongo import ReturnDocument
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# How often a process checks the shared version counter before trusting its snapshot.
+TASK_CATALOG_CHECK_INTERVAL = float(os.getenv("TASK_CATALOG_CHECK_INTERVAL", "2"))
+TASK_CATALOG_ENABLED = os.getenv("TASK_CATALOG_ENABLED", "1") == "1"
+
+# db.meta {_id: "task_catalog", version} is bumped on every task write; each
+# process reloads its snapshot when the version it loaded is no longer current.
+CATALOG_VERSION_ID = "task_catalog"
+
+
+class TaskCatalog:
+    """
+    Versioned in-process snapshot of db.tasks, newest first, without `_id`.
+    Callers get shallow copies, so they may add response fields to them.
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._tasks = []
+        self._by_id = {}
+
+    def _current_version(self):
+        doc = db.meta.find_one({"_id": CATALOG_VERSION_ID}, {"version": 1})
+        return doc.get("version", 0) if doc else 0
+
+    def _load(self, version):
+        tasks = [task for task in db.tasks.find({}, {"_id": 0}).sort("createdAt", -1) if task.get("taskId")]
+        self._tasks = tasks
+        self._by_id = {task["taskId"]: task for task in tasks}
+        self._version = version
+        logger.info("Loaded task catalog version %s with %s tasks", version, len(tasks))
+
+    def _refresh(self, force=False):
+        with self._lock:
+            now = time.time()
+            if not force and self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            version = self._current_version()
+            if version != self._version:
+                self._load(version)
+            self._checked_at = now
+
+    def tasks(self, force=False):
+        """Every task, newest first."""
+        self._refresh(force)
+        return [dict(task) for task in self._tasks]
+
+    def visible_tasks(self, limit=None):
+        """Tasks that are not hidden, newest first."""
+        self._refresh()
+        visible = [task for task in self._tasks if not task.get("hidden", False)]
+        return [dict(task) for task in visible[:limit]]
+
+    def get_task(self, task_id):
+        """A task by id, or None. A miss re-checks the version, so new tasks are found at once."""
+        self._refresh()
+        task = self._by_id.get(task_id)
+        if task is None:
+            self._refresh(force=True)
+            task = self._by_id.get(task_id)
+        return dict(task) if task else None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._tasks)
+
+    def invalidate(self):
+        """Bump the shared version so every process reloads, this one immediately."""
+        try:
+            doc = db.meta.find_one_and_update(
+                {"_id": CATALOG_VERSION_ID},
+                {"$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            logger.info("Task catalog invalidated, now version %s", doc["version"])
+        except Exception as e:
+            logger.error("Error bumping task catalog version: %s", e)
+        with self._lock:
+            self._version = None
+
+
+class UncachedTaskCatalog:
+    """Same interface straight from db.tasks, for TASK_CATALOG_ENABLED=0."""
+
+    def tasks(self, force=False):
+        return [task for task in db.tasks.find({}, {"_id": 0}).sort("createdAt", -1) if task.get("taskId")]
+
+    def visible_tasks(self, limit=None):
+        cursor = db.tasks.find({"hidden": {"$ne": True}}, {"_id": 0}).sort("createdAt", -1)
+        return list(cursor.limit(limit) if limit else cursor)
+
+    def get_task(self, task_id):
+        return db.tasks.find_one({"taskId": task_id}, {"_id": 0})
+
+    def __len__(self):
+        return db.tasks.count_documents({})
+
+    def invalidate(self):
+        pass
+
+
+task_catalog = TaskCatalog(TASK_CATALOG_CHECK_INTERVAL) if TASK_CATALOG_ENABLED else UncachedTaskCatalog()
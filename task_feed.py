@@ -0,0 +1,201 @@
+import os
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from db import db  # Ensure this imports your configured PyMongo instance
+from job_queue import JobWorkerPool, enqueue_job, ensure_job_indexes
+from task_catalog import task_catalog
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TASK_FEED_ENABLED = os.getenv("TASK_FEED_ENABLED", "1") == "1"
+FEED_WORKERS = int(os.getenv("FEED_WORKERS", "2"))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv("FEED_FANOUT_BATCH_SIZE", "1000"))
+
+# Task fields copied into each feed entry so a feed read needs no join.
+FEED_TASK_FIELDS = ("taskId", "title", "description", "message", "task_price", "hidden", "createdAt", "updatedAt")
+
+# Each user's feed lives in db.user_feed as one entry per task:
+#   {userId, taskId, createdAt, hidden, completed, task: {...}}
+# db.feed_state records which users have a seeded feed; only those receive fan-out.
+
+
+def ensure_feed_indexes():
+    try:
+        db.user_feed.create_index([("userId", 1), ("taskId", 1)], unique=True)
+        db.user_feed.create_index([("userId", 1), ("completed", 1), ("createdAt", -1)])
+        db.user_feed.create_index([("userId", 1), ("hidden", 1), ("createdAt", -1)])
+        db.user_feed.create_index("taskId")
+    except Exception as e:
+        logger.error("Error creating user feed indexes: %s", e)
+    ensure_job_indexes(db.feed_jobs)
+
+
+def task_summary(task_doc):
+    return {field: task_doc.get(field) for field in FEED_TASK_FIELDS}
+
+
+def _entry_update(user_id, task_doc, completed=None):
+    """Upsert for one feed entry; `completed` is only set on insert unless given."""
+    update = {"$set": {
+        "createdAt": task_doc.get("createdAt"),
+        "hidden": bool(task_doc.get("hidden", False)),
+        "task": task_summary(task_doc)
+    }}
+    if completed is None:
+        update["$setOnInsert"] = {"completed": False}
+    else:
+        update["$set"]["completed"] = completed
+    return UpdateOne({"userId": user_id, "taskId": task_doc["taskId"]}, update, upsert=True)
+
+
+def seed_user_feed(user_id):
+    """Build a user's feed from the task catalog and their verified task_history."""
+    # Mark the feed as seeded before reading tasks, so a task created meanwhile is
+    # either read here or fanned out to this user. The catalog version is checked
+    # now rather than trusting a snapshot that may predate the marker.
+    db.feed_state.update_one(
+        {"_id": user_id},
+        {"$setOnInsert": {"seededAt": datetime.utcnow()}},
+        upsert=True
+    )
+    completed_ids = set(db.task_history.distinct("taskId", {"userId": user_id, "verified": True}))
+    operations = [
+        _entry_update(user_id, task, task["taskId"] in completed_ids)
+        for task in task_catalog.tasks(force=True)
+    ]
+    if operations:
+        db.user_feed.bulk_write(operations, ordered=False)
+
+
+def _is_seeded(user_id):
+    return db.feed_state.find_one({"_id": user_id}, {"_id": 1}) is not None
+
+
+def next_feed_entry(user_id):
+    """Newest feed entry the user has not completed (hidden entries included), or None."""
+    query = {"userId": user_id, "completed": False}
+    entry = db.user_feed.find_one(query, {"_id": 0}, sort=[("createdAt", -1)])
+    if entry is None and not _is_seeded(user_id):
+        seed_user_feed(user_id)
+        entry = db.user_feed.find_one(query, {"_id": 0}, sort=[("createdAt", -1)])
+    return entry
+
+
+def latest_feed_entries(user_id, limit):
+    """Newest visible feed entries for the user."""
+    query = {"userId": user_id, "hidden": False}
+    entries = list(db.user_feed.find(query, {"_id": 0}).sort("createdAt", -1).limit(limit))
+    if not entries and not _is_seeded(user_id):
+        seed_user_feed(user_id)
+        entries = list(db.user_feed.find(query, {"_id": 0}).sort("createdAt", -1).limit(limit))
+    return entries
+
+
+def mark_feed_completed(user_id, task_id, session=None):
+    """
+    Mark the task completed in the user's feed. The entry is upserted, so a fan-out
+    that reaches this user later only fills in the task and cannot reopen it.
+    """
+    db.user_feed.update_one(
+        {"userId": user_id, "taskId": task_id},
+        {"$set": {"completed": True}},
+        upsert=True,
+        session=session
+    )
+
+
+def _schedule(kind, task_id):
+    if not TASK_FEED_ENABLED:
+        return
+    try:
+        enqueue_job(db.feed_jobs, {"kind": kind, "taskId": task_id})
+    except Exception as e:
+        logger.error("Error scheduling feed %s for task %s: %s", kind, task_id, e)
+
+
+def schedule_feed_fanout(task_id):
+    """Queue adding a new task to every seeded feed."""
+    _schedule("fanout", task_id)
+
+
+def schedule_feed_refresh(task_id):
+    """Queue re-copying a task's fields (including hidden) into every feed entry, or removing them if deleted."""
+    _schedule("refresh", task_id)
+
+
+def _refresh_entries(task_doc):
+    """Copy the task's current fields into every feed entry for it."""
+    result = db.user_feed.update_many({"taskId": task_doc["taskId"]}, {"$set": {
+        "createdAt": task_doc.get("createdAt"),
+        "hidden": bool(task_doc.get("hidden", False)),
+        "task": task_summary(task_doc)
+    }})
+    return result.modified_count
+
+
+def _current_task(task_id):
+    return db.tasks.find_one({"taskId": task_id}, {"_id": 0})
+
+
+def _fan_out(task_doc):
+    """
+    Add the task to every seeded feed. A fan-out can take minutes, so the task is
+    re-read before each batch: a deletion meanwhile stops it and removes what it
+    wrote, and an edit is picked up and copied into the entries already written.
+    """
+    task_id = task_doc["taskId"]
+    batches = db.feed_state.find({}, {"_id": 1}).batch_size(FEED_FANOUT_BATCH_SIZE)
+    user_ids, written, changed, exhausted = [], 0, False, False
+    while not exhausted:
+        state = next(batches, None)
+        if state is not None:
+            user_ids.append(state["_id"])
+            if len(user_ids) < FEED_FANOUT_BATCH_SIZE:
+                continue
+        else:
+            exhausted = True
+            if not user_ids:
+                break
+        current = _current_task(task_id)
+        if current is None:
+            break
+        changed = changed or current != task_doc
+        task_doc = current
+        db.user_feed.bulk_write([_entry_update(user_id, task_doc) for user_id in user_ids], ordered=False)
+        written += len(user_ids)
+        user_ids = []
+
+    # Settle against the task as it is after the last write: a delete or edit may
+    # have landed after the last read, and its own refresh job may already have run.
+    current = _current_task(task_id)
+    if current is None:
+        db.user_feed.delete_many({"taskId": task_id})
+        return 0
+    if changed or current != task_doc:
+        _refresh_entries(current)
+    return written
+
+
+def process_feed_job(job):
+    task_id = job["taskId"]
+    task_doc = _current_task(task_id)
+    if not task_doc:
+        result = db.user_feed.delete_many({"taskId": task_id})
+        return {"removed": result.deleted_count}
+    if job.get("kind") == "fanout":
+        return {"fanned_out": _fan_out(task_doc)}
+    return {"refreshed": _refresh_entries(task_doc)}
+
+
+feed_job_workers = JobWorkerPool(db.feed_jobs, process_feed_job, "feed", lease_seconds=600)
+
+
+def start_feed_workers():
+    """Start this process's share of feed fan-out workers."""
+    if TASK_FEED_ENABLED:
+        feed_job_workers.start(FEED_WORKERS)
@@ -1,13 +1,53 @@
 from flask import Blueprint, request
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
 import re
+import logging
 
 from db import db  # Adjust this import to match your actual db.py
-from utils import format_response  # Centralized response formatter
+from utils import format_response, keyset_query, next_cursor, InvalidCursor  # Centralized response formatter
+from submissions import get_submission_counts
+from task_catalog import task_catalog
+from task_versions import record_task_version, get_task_versions, VERSION_FIELDS
+from search_index import (
+    search, index_document, reindex, remove_document,
+    encode_search_cursor, decode_search_cursor, InvalidSearchCursor
+)
+from task_feed import (
+    TASK_FEED_ENABLED, next_feed_entry, latest_feed_entries,
+    schedule_feed_fanout, schedule_feed_refresh
+)
 
 task_bp = Blueprint("task", __name__, url_prefix="/task")
 
+# Page size for /task/history.
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+# History fields a client may request; taskVersion refers to db.task_versions.
+HISTORY_FIELDS = (
+    "taskId", "task_name", "task_price", "matched_link", "participant_count",
+    "verified", "verifiedAt", "taskVersion"
+)
+
+# Page size for /task/latestTask.
+DEFAULT_LATEST_TASKS = 4
+MAX_LATEST_TASKS = 50
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+def ensure_task_indexes():
+    """Indexes backing the user-facing task queries."""
+    try:
+        db.tasks.create_index([("createdAt", -1), ("_id", -1)])
+        db.tasks.create_index("taskId")
+        db.task_history.create_index([("userId", 1), ("taskId", 1), ("verified", 1)])
+        db.task_history.create_index([("userId", 1), ("verifiedAt", -1), ("_id", -1)])
+    except Exception as e:
+        logger.error("Error creating task indexes: %s", e)
+
 def is_valid_url(url: str) -> bool:
     pattern = r'^(https?|ftp)://[^\s/$.?#].[^\s]*$'
     return bool(re.match(pattern, url))
@@ -56,11 +96,16 @@ def create_task():
             "message": message,
             "task_price": task_price,
             "hidden": hidden,
+            "version": 1,
             "createdAt": datetime.utcnow(),
             "updatedAt": datetime.utcnow()
         }
 
         db.tasks.insert_one(task_doc)
+        record_task_version(task_doc)
+        task_catalog.invalidate()
+        index_document("task", task_doc)
+        schedule_feed_fanout(task_id_str)
         return format_response(True, "Task created successfully", {"taskId": task_id_str}, 201)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
@@ -106,10 +151,21 @@ def update_task():
         if not update_fields:
             return format_response(False, "No valid fields to update", None, 400)
 
+        # Every content change is a new task version; history keeps pointing at the old one.
         update_fields["updatedAt"] = datetime.utcnow()
-        result = db.tasks.update_one({"taskId": task_id}, {"$set": update_fields})
-        if result.matched_count == 0:
+        task_doc = db.tasks.find_one_and_update(
+            {"taskId": task_id},
+            {"$set": update_fields, "$inc": {"version": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if task_doc is None:
             return format_response(False, "Task not found", None, 404)
+        record_task_version(task_doc)
+        task_catalog.invalidate()
+        if {"title", "description", "message"} & set(update_fields):
+            reindex("task", task_id)
+        schedule_feed_refresh(task_id)
         return format_response(True, "Task updated successfully", None, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
@@ -124,12 +180,30 @@ def delete_task():
         result = db.tasks.delete_one({"taskId": task_id})
         if result.deleted_count == 0:
             return format_response(False, "Task not found", None, 404)
+        task_catalog.invalidate()
+        remove_document("task", task_id)
+        schedule_feed_refresh(task_id)
         return format_response(True, "Task deleted successfully", None, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
 
 @task_bp.route("/getall", methods=["POST"])
 def get_all_tasks():
+    """
+    POST /task/getall
+    JSON Body:
+    {
+      "keyword": "optional search text",
+      "per_page": 50,
+      "page": 0,              # offset pagination
+      "cursor": "",           # keyset pagination: send "" for the first page, then next_cursor
+      "include_total": false  # cursor mode only; estimated when there is no keyword
+    }
+
+    With a keyword, tasks whose title, description or message contain words
+    starting with every search term are returned, best matches first. Only the
+    newest SEARCH_MAX_CANDIDATES matches are ranked and counted.
+    """
     try:
         data = request.get_json() or {}
         keyword = data.get("keyword", "").strip()
@@ -142,23 +216,41 @@ def get_all_tasks():
         except ValueError:
             return format_response(False, "per_page must be an integer", None, 400)
 
-        query = {}
         if keyword:
-            query["$or"] = [
-                {"title": {"$regex": keyword, "$options": "i"}},
-                {"description": {"$regex": keyword, "$options": "i"}},
-                {"message": {"$regex": keyword, "$options": "i"}},
-                {"status": {"$regex": keyword, "$options": "i"}}
-            ]
-        total_items = db.tasks.count_documents(query)
-        tasks_cursor = db.tasks.find(query, {"_id": 0}).sort("createdAt", -1).skip(page * per_page).limit(per_page)
-        tasks_list = list(tasks_cursor)
+            # Ranked search through the token index; in cursor mode the cursor carries the offset.
+            try:
+                offset = decode_search_cursor(data.get("cursor")) if "cursor" in data else page * per_page
+            except InvalidSearchCursor:
+                return format_response(False, "Invalid cursor", None, 400)
+            with_total = "cursor" not in data or bool(data.get("include_total"))
+            keys, total_items = search("task", keyword, offset, per_page, with_total)
+            tasks_list = [task for task in map(task_catalog.get_task, keys) if task]
+            cursor_out = encode_search_cursor(offset + per_page) if "cursor" in data and len(keys) == per_page else None
+        elif "cursor" in data:
+            # Keyset pagination on (createdAt, _id); the total is only computed on request.
+            try:
+                page_query = keyset_query({}, data.get("cursor"), "createdAt")
+            except InvalidCursor:
+                return format_response(False, "Invalid cursor", None, 400)
+            tasks_list = list(db.tasks.find(page_query).sort([("createdAt", -1), ("_id", -1)]).limit(per_page))
+            cursor_out = next_cursor(tasks_list, per_page, "createdAt")
+            total_items = db.tasks.estimated_document_count() if data.get("include_total") else None
+            for task in tasks_list:
+                task.pop("_id", None)
+        else:
+            cursor_out = None
+            all_tasks = task_catalog.tasks()
+            total_items = len(all_tasks)
+            tasks_list = all_tasks[page * per_page:(page + 1) * per_page]
+        submission_counts = get_submission_counts([task["taskId"] for task in tasks_list])
         for task in tasks_list:
             task["status"] = task.get("status", "pending")
+            task["submission_counts"] = submission_counts.get(task["taskId"])
         return format_response(True, "Tasks retrieved successfully", {
             "total": total_items,
             "page": page,
             "per_page": per_page,
+            "next_cursor": cursor_out,
             "tasks": tasks_list
         }, 200)
     except Exception as e:
@@ -170,13 +262,18 @@ def get_task_by_id():
         task_id = request.args.get("taskId", "").strip()
         if not task_id:
             return format_response(False, "taskId query parameter is required", None, 400)
-        task_doc = db.tasks.find_one({"taskId": task_id}, {"_id": 0})
+        task_doc = task_catalog.get_task(task_id)
         if not task_doc:
             return format_response(False, "Task not found", None, 404)
         return format_response(True, "Task retrieved successfully", {"task": task_doc}, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
 
+def select_next_task(user_id):
+    """Newest catalog task without a verified history entry for this user, in one round trip."""
+    completed_ids = set(db.task_history.distinct("taskId", {"userId": user_id, "verified": True}))
+    return next((task for task in task_catalog.tasks() if task["taskId"] not in completed_ids), None)
+
 @task_bp.route("/newtask", methods=["POST"])
 def new_task():
     """
@@ -196,19 +293,11 @@ def new_task():
         if not user_id:
             return format_response(False, "userId is required", None, 400)
 
-        tasks_cursor = db.tasks.find({}, {"_id": 0}).sort("createdAt", -1)
-        candidate_task = None
-        for task in tasks_cursor:
-            if user_id:
-                history_entry = db.task_history.find_one({
-                    "userId": user_id,
-                    "taskId": task["taskId"],
-                    "verified": True
-                })
-                if history_entry:
-                    continue
-            candidate_task = task
-            break
+        if TASK_FEED_ENABLED:
+            entry = next_feed_entry(user_id)
+            candidate_task = entry["task"] if entry else None
+        else:
+            candidate_task = select_next_task(user_id)
 
         if not candidate_task:
             return format_response(True, "Task will upload soon...", None, 200)
@@ -220,23 +309,101 @@ def new_task():
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
 
+def _parse_history_date(value, name):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except (AttributeError, ValueError):
+        raise ValueError(f"{name} must be an ISO 8601 date")
+
+def _attach_task_versions(records):
+    """Add each record's task content: from its version, or the legacy embedded task_details."""
+    versions = get_task_versions(
+        (record["taskId"], record["taskVersion"]) for record in records if "taskVersion" in record
+    )
+    for record in records:
+        legacy = record.pop("task_details", None)
+        if "taskVersion" in record:
+            record["task"] = versions.get((record["taskId"], record["taskVersion"]))
+        elif isinstance(legacy, dict):
+            record["task"] = {field: legacy.get(field) for field in ("taskId",) + VERSION_FIELDS}
+        else:
+            record["task"] = None
+
 @task_bp.route("/history", methods=["POST"])
 def get_task_history():
+    """
+    POST /task/history
+    JSON Body:
+    {
+      "userId": "user123",
+      "per_page": 50,            # optional, 1-200
+      "cursor": "",              # send "" or omit for the first page, then next_cursor
+      "fields": ["taskId", ...], # optional subset of HISTORY_FIELDS
+      "from": "2025-04-01",      # optional, verifiedAt >= from
+      "to": "2025-05-01",        # optional, verifiedAt < to
+      "include_task": false      # optional, add the task as it was when completed
+    }
+
+    Newest first. Records reference the task version they were completed
+    against instead of embedding the task.
+    """
     try:
         data = request.get_json() or {}
         user_id = data.get("userId", "").strip()
         if not user_id:
             return format_response(False, "userId is required", None, 400)
 
-        tasks_cursor = db.task_history.find({"userId": user_id}, {"_id": 0}).sort("verifiedAt", -1)
-        tasks_list = list(tasks_cursor)
-        
-        # Remove the _id field from embedded task_details, if present.
-        for task in tasks_list:
-            if "task_details" in task and isinstance(task["task_details"], dict):
-                task["task_details"].pop("_id", None)
-        
-        return format_response(True, "Task history retrieved successfully", {"task_history": tasks_list}, 200)
+        try:
+            per_page = int(data.get("per_page", DEFAULT_HISTORY_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return format_response(False, "per_page must be an integer", None, 400)
+        if per_page < 1 or per_page > MAX_HISTORY_PAGE_SIZE:
+            return format_response(False, f"per_page must be between 1 and {MAX_HISTORY_PAGE_SIZE}", None, 400)
+
+        fields = data.get("fields") or list(HISTORY_FIELDS)
+        if not isinstance(fields, list) or any(field not in HISTORY_FIELDS for field in fields):
+            return format_response(False, f"fields must be a list drawn from: {', '.join(HISTORY_FIELDS)}", None, 400)
+        include_task = bool(data.get("include_task", False))
+
+        query = {"userId": user_id}
+        date_range = {}
+        try:
+            if data.get("from"):
+                date_range["$gte"] = _parse_history_date(data["from"], "from")
+            if data.get("to"):
+                date_range["$lt"] = _parse_history_date(data["to"], "to")
+        except ValueError as e:
+            return format_response(False, str(e), None, 400)
+        if date_range:
+            query["verifiedAt"] = date_range
+
+        try:
+            page_query = keyset_query(query, data.get("cursor"), "verifiedAt")
+        except InvalidCursor:
+            return format_response(False, "Invalid cursor", None, 400)
+
+        # The cursor needs _id and verifiedAt, and task lookups need taskId/taskVersion.
+        projection = {field: 1 for field in fields}
+        projection.update({"verifiedAt": 1})
+        if include_task:
+            projection.update({"taskId": 1, "taskVersion": 1, "task_details": 1})
+        records = list(db.task_history.find(page_query, projection)
+                       .sort([("verifiedAt", -1), ("_id", -1)]).limit(per_page))
+        cursor_out = next_cursor(records, per_page, "verifiedAt")
+
+        if include_task:
+            _attach_task_versions(records)
+        for record in records:
+            record.pop("_id", None)
+            for field in ("verifiedAt", "taskId", "taskVersion"):
+                if field not in fields:
+                    record.pop(field, None)
+
+        return format_response(True, "Task history retrieved successfully", {
+            "per_page": per_page,
+            "next_cursor": cursor_out,
+            "task_history": records
+        }, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
 
@@ -261,10 +428,12 @@ def toggle_hide_task():
         result = db.tasks.update_one({"taskId": task_id}, {"$set": {"hidden": hidden, "updatedAt": datetime.utcnow()}})
         if result.matched_count == 0:
             return format_response(False, "Task not found", None, 404)
+        task_catalog.invalidate()
+        schedule_feed_refresh(task_id)
         if hidden:
             return format_response(True, "Task will upload soon...", {"taskId": task_id}, 200)
         else:
-            task = db.tasks.find_one({"taskId": task_id}, {"_id": 0})
+            task = task_catalog.get_task(task_id)
             return format_response(True, "Task unhidden successfully", {"task": task}, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
@@ -275,7 +444,8 @@ def getLatestTask():
     POST /task/latestTask
     JSON Body:
     {
-      "userId": "user123"
+      "userId": "user123",
+      "limit": 4   # optional, number of tasks to return (1-50, default 4)
     }
     
     Returns:
@@ -310,17 +480,31 @@ def getLatestTask():
         if not user_id:
             return format_response(False, "userId is required", None, 400)
 
-        tasks_cursor = db.tasks.find({"hidden": {"$ne": True}}, {"_id": 0}).sort("createdAt", -1).limit(4)
-        tasks_list = list(tasks_cursor)
+        try:
+            limit = int(data.get("limit", DEFAULT_LATEST_TASKS))
+        except (TypeError, ValueError):
+            return format_response(False, "limit must be an integer", None, 400)
+        if limit < 1 or limit > MAX_LATEST_TASKS:
+            return format_response(False, f"limit must be between 1 and {MAX_LATEST_TASKS}", None, 400)
+
+        if TASK_FEED_ENABLED:
+            entries = latest_feed_entries(user_id, limit)
+            tasks_list = [entry["task"] for entry in entries]
+            completed_ids = {entry["taskId"] for entry in entries if entry.get("completed")}
+        else:
+            tasks_list = task_catalog.visible_tasks(limit)
+
+            # Completion state for every returned task in a single query.
+            completed_ids = {
+                entry["taskId"] for entry in db.task_history.find(
+                    {"userId": user_id, "verified": True, "taskId": {"$in": [task.get("taskId") for task in tasks_list]}},
+                    {"_id": 0, "taskId": 1}
+                )
+            }
 
         unlocked_found = False
         for task in tasks_list:
-            history_entry = db.task_history.find_one({
-                "userId": user_id,
-                "taskId": task.get("taskId"),
-                "verified": True
-            })
-            if history_entry:
+            if task.get("taskId") in completed_ids:
                 task["status"] = "completed"
             else:
                 if not unlocked_found:
@@ -0,0 +1,54 @@
+import logging
+from datetime import datetime
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Task content captured per version; hiding a task does not create a version.
+VERSION_FIELDS = ("title", "description", "message", "task_price")
+
+# db.task_versions holds one immutable document per task content version:
+#   {_id: "<taskId>:<version>", taskId, version, title, description, message, task_price, createdAt}
+# Tasks carry their current `version`; tasks created before versioning count as version 0.
+
+
+def ensure_task_version_indexes():
+    try:
+        db.task_versions.create_index([("taskId", 1), ("version", -1)])
+    except Exception as e:
+        logger.error("Error creating task version indexes: %s", e)
+
+
+def task_version(task_doc):
+    return task_doc.get("version", 0)
+
+
+def record_task_version(task_doc):
+    """Store the task's current content under its version, once. Returns the version."""
+    version = task_version(task_doc)
+    snapshot = {field: task_doc.get(field) for field in VERSION_FIELDS}
+    snapshot.update({
+        "taskId": task_doc["taskId"],
+        "version": version,
+        "createdAt": task_doc.get("updatedAt") or datetime.utcnow()
+    })
+    db.task_versions.update_one(
+        {"_id": f"{task_doc['taskId']}:{version}"},
+        {"$setOnInsert": snapshot},
+        upsert=True
+    )
+    return version
+
+
+def get_task_versions(refs):
+    """Resolve (taskId, version) pairs in one query; returns {(taskId, version): task fields}."""
+    ids = list({f"{task_id}:{version}" for task_id, version in refs})
+    if not ids:
+        return {}
+    return {
+        (doc["taskId"], doc["version"]): doc
+        for doc in db.task_versions.find({"_id": {"$in": ids}}, {"_id": 0, "createdAt": 0})
+    }
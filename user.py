@@ -10,14 +10,33 @@ from db import db  # Adjust this import to match your actual db.py
 from twilio.rest import Client
 from dotenv import load_dotenv
 import os
+import logging
 
 # Import the centralized response formatter from your utils module.
-from utils import format_response
+from utils import format_response, keyset_query, next_cursor, InvalidCursor
+from search_index import (
+    search, fetch_in_order, index_document, reindex, remove_document,
+    encode_search_cursor, decode_search_cursor, InvalidSearchCursor
+)
 
 load_dotenv()
 
 user_bp = Blueprint("user", __name__, url_prefix="/user")
 
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def ensure_user_indexes():
+    """Indexes backing the admin user listing and userId lookups."""
+    try:
+        db.users.create_index([("createdAt", -1), ("_id", -1)])
+        db.users.create_index("userId")
+    except Exception as e:
+        logger.error("Error creating user indexes: %s", e)
+
+
 # Twilio configuration
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN  = os.getenv("TWILIO_AUTH_TOKEN")
@@ -223,13 +242,14 @@ def register():
         }
         
         db.users.insert_one(user_doc)
+        index_document("user", user_doc)
         
         wallet_doc = {
             "userId": user_id_str,
             "total_earning": 0,
             "withdrawn": 0,
             "balance": 0,
-            "tasks": [],
+            "no_of_tasks_done": 0,
             "createdAt": datetime.datetime.utcnow(),
             "updatedAt": datetime.datetime.utcnow()
         }
@@ -300,6 +320,21 @@ def login_verify_otp():
 
 @user_bp.route("/getlist", methods=["POST"])
 def get_user_list():
+    """
+    POST /user/getlist
+    JSON Body:
+    {
+      "keyword": "optional search text",
+      "per_page": 50,
+      "page": 0,              # offset pagination
+      "cursor": "",           # keyset pagination: send "" for the first page, then next_cursor
+      "include_total": false  # cursor mode only; estimated when there is no keyword
+    }
+
+    With a keyword, users whose name, email or phone contain words starting with
+    every search term (or phone numbers ending in it) are returned, best matches first.
+    Only the newest SEARCH_MAX_CANDIDATES matches are ranked and counted.
+    """
     try:
         data = request.get_json() or {}
         keyword = data.get("keyword", "")
@@ -312,23 +347,38 @@ def get_user_list():
         except ValueError:
             return format_response(False, "per_page must be an integer.", None, 400)
 
-        query = {}
         if keyword:
-            query = {
-                "$or": [
-                    {"name": {"$regex": keyword, "$options": "i"}},
-                    {"email": {"$regex": keyword, "$options": "i"}},
-                    {"phone": {"$regex": keyword, "$options": "i"}}
-                ]
-            }
-
-        total_items = db.users.count_documents(query)
-        users_cursor = db.users.find(query, {"_id": 0, "passwordHash": 0}).skip(page * per_page).limit(per_page)
-        users_list = list(users_cursor)
+            # Ranked search through the token index; in cursor mode the cursor carries the offset.
+            try:
+                offset = decode_search_cursor(data.get("cursor")) if "cursor" in data else page * per_page
+            except InvalidSearchCursor:
+                return format_response(False, "Invalid cursor", None, 400)
+            with_total = "cursor" not in data or bool(data.get("include_total"))
+            keys, total_items = search("user", keyword, offset, per_page, with_total)
+            users_list = fetch_in_order(db.users, "userId", keys, {"_id": 0, "passwordHash": 0})
+            cursor_out = encode_search_cursor(offset + per_page) if "cursor" in data and len(keys) == per_page else None
+        elif "cursor" in data:
+            # Keyset pagination on (createdAt, _id); the total is only computed on request.
+            try:
+                page_query = keyset_query({}, data.get("cursor"), "createdAt")
+            except InvalidCursor:
+                return format_response(False, "Invalid cursor", None, 400)
+            users_list = list(db.users.find(page_query, {"passwordHash": 0})
+                              .sort([("createdAt", -1), ("_id", -1)]).limit(per_page))
+            cursor_out = next_cursor(users_list, per_page, "createdAt")
+            total_items = db.users.estimated_document_count() if data.get("include_total") else None
+            for user in users_list:
+                user.pop("_id", None)
+        else:
+            cursor_out = None
+            total_items = db.users.count_documents({})
+            users_cursor = db.users.find({}, {"_id": 0, "passwordHash": 0}).skip(page * per_page).limit(per_page)
+            users_list = list(users_cursor)
         return format_response(True, "User list retrieved successfully", {
             "total": total_items,
             "page": page,
             "per_page": per_page,
+            "next_cursor": cursor_out,
             "users": users_list
         }, 200)
     except Exception as e:
@@ -366,6 +416,7 @@ def delete_user():
         result = db.users.delete_one({"userId": user_id})
         if result.deleted_count == 0:
             return format_response(False, "User not found", None, 404)
+        remove_document("user", user_id)
         return format_response(True, "User deleted successfully", None, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
@@ -494,6 +545,8 @@ def update_user_details():
         result = db.users.update_one({"userId": user_id}, {"$set": update_fields})
         if result.matched_count == 0:
             return format_response(False, "User not found.", None, 404)
+        if {"name", "email"} & set(update_fields):
+            reindex("user", user_id)
         return format_response(True, "User details updated.", None, 200)
     except Exception as e:
         return format_response(False, f"Server error: {str(e)}", None, 500)
\ No newline at end of file
@@ -1,5 +1,9 @@
 # Centralized Response Formatter
 
+import json
+import base64
+import datetime
+from bson import ObjectId
 from flask import jsonify,Blueprint
 utils_bp = Blueprint('utils', __name__, url_prefix="/util")
 
@@ -27,6 +31,52 @@ def format_response(success: bool, message: str, data=None, status: int = 200):
 
 
 
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(doc, sort_field):
+    """
+    Build an opaque keyset cursor from the last document of a page, sorted by
+    (sort_field, _id) descending.
+    """
+    value = doc.get(sort_field)
+    payload = {
+        "v": value.isoformat() if isinstance(value, datetime.datetime) else value,
+        "id": str(doc["_id"])
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def keyset_query(query, cursor, sort_field):
+    """
+    Return `query` restricted to documents after `cursor` in (sort_field, _id)
+    descending order. An empty cursor means the first page.
+    """
+    if not cursor:
+        return query
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        value = payload["v"]
+        if isinstance(value, str):
+            value = datetime.datetime.fromisoformat(value)
+        last_id = ObjectId(payload["id"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    after = {"$or": [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "_id": {"$lt": last_id}}
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+def next_cursor(page_docs, per_page, sort_field):
+    """Cursor for the page after `page_docs`, or None if this was the last page."""
+    if len(page_docs) < per_page or not page_docs:
+        return None
+    return encode_cursor(page_docs[-1], sort_field)
+
+
 @utils_bp.errorhandler(404)
 def resource_not_found(e):
     return format_response(False, "Resource not found.", None, 404)
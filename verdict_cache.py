@@ -0,0 +1,91 @@
+import os
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from db import db  # Ensure this imports your configured PyMongo instance
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+VERDICT_CACHE_TTL_SECONDS = int(os.getenv("VERDICT_CACHE_TTL_SECONDS", str(24 * 3600)))
+VERDICT_CACHE_LRU_SIZE = int(os.getenv("VERDICT_CACHE_LRU_SIZE", "2048"))
+
+verdict_cache_collection = db["verdict_cache"]
+
+
+def verdict_cache_key(image_bytes, variant, expected_link=""):
+    """Content address of a verdict: SHA-256 of the image plus the prompt variant and expected link."""
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(
+        "\0".join([image_digest, variant, expected_link or ""]).encode("utf-8")
+    ).hexdigest()
+
+
+class VerdictCache:
+    """
+    In-process LRU in front of the TTL-indexed db.verdict_cache collection. Each
+    entry keeps the expiry of its stored verdict, so the LRU never serves a
+    verdict the collection has already dropped.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _remember(self, key, verdict, created_at):
+        expires_at = created_at + timedelta(seconds=VERDICT_CACHE_TTL_SECONDS)
+        with self._lock:
+            self._entries[key] = (verdict, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                del self._entries[key]
+        try:
+            doc = verdict_cache_collection.find_one({"_id": key}, {"verdict": 1, "createdAt": 1})
+        except Exception as e:
+            logger.warning("Verdict cache lookup failed: %s", e)
+            return None
+        if not doc:
+            return None
+        # The TTL monitor only runs periodically, so an expired document may still be there.
+        created_at = doc.get("createdAt") or now
+        if created_at + timedelta(seconds=VERDICT_CACHE_TTL_SECONDS) <= now:
+            return None
+        self._remember(key, doc["verdict"], created_at)
+        return doc["verdict"]
+
+    def set(self, key, variant, verdict):
+        now = datetime.utcnow()
+        self._remember(key, verdict, now)
+        try:
+            verdict_cache_collection.replace_one(
+                {"_id": key},
+                {"_id": key, "variant": variant, "verdict": verdict, "createdAt": now},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning("Verdict cache store failed: %s", e)
+
+
+def ensure_verdict_cache_indexes():
+    try:
+        verdict_cache_collection.create_index("createdAt", expireAfterSeconds=VERDICT_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.error("Error creating verdict cache TTL index: %s", e)
+
+
+verdict_cache = VerdictCache(VERDICT_CACHE_LRU_SIZE)
@@ -1,32 +1,318 @@
 from flask import Blueprint, request
+import os
+import json
+import base64
 import datetime
+import logging
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 from db import db  # Adjust this import based on your project's structure
 from utils import format_response  # Centralized response formatter
 
 wallet_bp = Blueprint("wallet", __name__, url_prefix="/wallet")
 
-def update_wallet_after_task(user_id: str, task_id: str, price: float):
-    """
-    Update the user's wallet after completing a task.
-    It increments the total earning and balance by the given task price and appends the task details.
-    If no wallet exists for the given user_id, it returns an error.
-    """
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Entries per ledger bucket; a month with more entries spills into further buckets.
+LEDGER_BUCKET_SIZE = int(os.getenv("LEDGER_BUCKET_SIZE", "200"))
+# Credit ids remembered on the wallet so a retried task credit is applied once.
+RECENT_CREDIT_IDS = int(os.getenv("RECENT_CREDIT_IDS", "100"))
+# How long a withdrawal hold may stay open before the sweeper settles it.
+WALLET_HOLD_TTL_SECONDS = int(os.getenv("WALLET_HOLD_TTL_SECONDS", "600"))
+DEFAULT_TRANSACTIONS_PAGE_SIZE = 20
+MAX_TRANSACTIONS_PAGE_SIZE = 100
+
+# Wallet entries live in db.wallet_ledger, bucketed per user and month:
+#   {userId, month: "YYYY-MM", count, first_at, last_at,
+#    entries: [{type: "task" | "withdrawal" | "withdrawal_reversal", amount, at, taskId | payoutId, creditId}]}
+# The wallet document itself only keeps counters: total_earning, withdrawn,
+# balance and no_of_tasks_done, plus `held` and the open withdrawal `holds`
+# [{holdId, amount, createdAt, expiresAt}] reserved out of balance.
+
+
+class InvalidLedgerCursor(ValueError):
+    """Raised when a transactions cursor cannot be decoded."""
+
+
+class WalletNotFound(Exception):
+    """Raised when crediting a user who has no wallet."""
+
+
+class InsufficientBalance(Exception):
+    """Raised when a reservation exceeds the wallet's available balance."""
+
+
+def ensure_wallet_indexes():
     try:
-        wallet = db.wallet.find_one({"userId": user_id})
-        if not wallet:
-            return {"error": "Invalid user. Wallet not found."}
-        
-        db.wallet.update_one(
-            {"userId": user_id},
-            {
-                "$inc": {"total_earning": price, "balance": price},
-                "$push": {"tasks": {"taskId": task_id, "price": price}},
-                "$set": {"updatedAt": datetime.datetime.utcnow()}
-            }
+        db.wallet.create_index("userId")
+        db.wallet_ledger.create_index([("userId", 1), ("month", 1), ("count", 1)])
+        db.wallet_ledger.create_index([("userId", 1), ("first_at", -1), ("_id", -1)])
+        db.wallet_ledger.create_index("entries.creditId", sparse=True)
+        db.wallet.create_index("holds.expiresAt", sparse=True)
+        db.wallet_ledger.create_index(
+            [("userId", 1), ("legacy_part", 1)], unique=True,
+            partialFilterExpression={"legacy_part": {"$exists": True}}
         )
-        return {"message": "Wallet updated successfully."}
     except Exception as e:
-        return {"error": f"Server error: {str(e)}"}
+        logger.error("Error creating wallet indexes: %s", e)
+
+
+def record_ledger_entry(user_id: str, entry_type: str, amount: float, at=None, session=None, **refs):
+    """Append an entry to the user's ledger bucket for the month, opening a new bucket when full."""
+    at = at or datetime.datetime.utcnow()
+    entry = {"type": entry_type, "amount": amount, "at": at}
+    entry.update(refs)
+    db.wallet_ledger.update_one(
+        {"userId": user_id, "month": at.strftime("%Y-%m"), "count": {"$lt": LEDGER_BUCKET_SIZE}},
+        {
+            "$push": {"entries": entry},
+            "$inc": {"count": 1},
+            "$min": {"first_at": at},
+            "$max": {"last_at": at}
+        },
+        upsert=True,
+        session=session
+    )
+
+
+def migrate_legacy_tasks(user_id: str):
+    """
+    Move a wallet's embedded `tasks` array into the ledger. The buckets are written
+    first, keyed by `legacy_part` so a retry rewrites nothing; the array is then
+    counted and removed in one update, so an interrupted migration simply reruns.
+    """
+    wallet = db.wallet.find_one({"userId": user_id, "tasks": {"$exists": True}}, {"tasks": 1, "createdAt": 1})
+    if not wallet:
+        return
+    tasks = wallet.get("tasks") or []
+    # Legacy entries carry no timestamp; file them under the wallet's creation date.
+    at = wallet.get("createdAt") or datetime.datetime.utcnow()
+    buckets = []
+    for part, start in enumerate(range(0, len(tasks), LEDGER_BUCKET_SIZE)):
+        entries = [
+            {"type": "task", "amount": task.get("price", 0), "at": at, "taskId": task.get("taskId")}
+            for task in tasks[start:start + LEDGER_BUCKET_SIZE]
+        ]
+        buckets.append(UpdateOne(
+            {"userId": user_id, "legacy_part": part},
+            {"$setOnInsert": {
+                "month": at.strftime("%Y-%m"),
+                "count": len(entries),
+                "first_at": at,
+                "last_at": at,
+                "entries": entries
+            }},
+            upsert=True
+        ))
+    if buckets:
+        db.wallet_ledger.bulk_write(buckets, ordered=False)
+    result = db.wallet.update_one(
+        {"userId": user_id, "tasks": {"$exists": True}},
+        [
+            {"$set": {"no_of_tasks_done": {"$add": [
+                {"$ifNull": ["$no_of_tasks_done", 0]},
+                {"$size": {"$ifNull": ["$tasks", []]}}
+            ]}}},
+            {"$unset": "tasks"}
+        ]
+    )
+    if result.modified_count:
+        logger.info("Migrated %s legacy wallet tasks for user %s", len(tasks), user_id)
+
+
+def credit_wallet_for_task(user_id: str, task_id: str, price: float, credit_id: str, session=None):
+    """
+    Credit a completed task to the user's wallet and ledger, at most once per `credit_id`.
+    Returns True if the credit was applied now, False if it had been already
+    (a missing ledger entry from an interrupted earlier attempt is filled in).
+    Raises WalletNotFound if the user has no wallet.
+    """
+    now = datetime.datetime.utcnow()
+    result = db.wallet.update_one(
+        {"userId": user_id, "recent_credit_ids": {"$ne": credit_id}},
+        {
+            "$inc": {"total_earning": price, "balance": price, "no_of_tasks_done": 1},
+            "$push": {"recent_credit_ids": {"$each": [credit_id], "$slice": -RECENT_CREDIT_IDS}},
+            "$set": {"updatedAt": now}
+        },
+        session=session
+    )
+    if result.matched_count == 0:
+        if db.wallet.find_one({"userId": user_id}, {"_id": 1}, session=session) is None:
+            raise WalletNotFound("Invalid user. Wallet not found.")
+        if db.wallet_ledger.find_one({"userId": user_id, "entries.creditId": credit_id}, {"_id": 1}, session=session):
+            return False
+        record_ledger_entry(user_id, "task", price, now, session=session, taskId=task_id, creditId=credit_id)
+        return False
+    record_ledger_entry(user_id, "task", price, now, session=session, taskId=task_id, creditId=credit_id)
+    return True
+
+
+def reserve_funds(user_id: str, amount: float, hold_id: str, ttl_seconds: int = WALLET_HOLD_TTL_SECONDS):
+    """
+    Atomically move `amount` from balance into held, if the balance covers it.
+    Returns the wallet after the reservation. Raises InsufficientBalance or WalletNotFound.
+    """
+    now = datetime.datetime.utcnow()
+    wallet = db.wallet.find_one_and_update(
+        {"userId": user_id, "balance": {"$gte": amount}},
+        {
+            "$inc": {"balance": -amount, "held": amount},
+            "$push": {"holds": {
+                "holdId": hold_id,
+                "amount": amount,
+                "createdAt": now,
+                "expiresAt": now + datetime.timedelta(seconds=ttl_seconds)
+            }},
+            "$set": {"updatedAt": now}
+        },
+        projection={"_id": 0, "balance": 1, "held": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if wallet is None:
+        if db.wallet.find_one({"userId": user_id}, {"_id": 1}) is None:
+            raise WalletNotFound("Wallet not found for user")
+        raise InsufficientBalance("Insufficient wallet balance")
+    return wallet
+
+
+def _hold_amount(user_id: str, hold_id: str):
+    """The amount reserved by an open hold, or None if it was already settled."""
+    wallet = db.wallet.find_one({"userId": user_id, "holds.holdId": hold_id}, {"holds.$": 1})
+    return wallet["holds"][0]["amount"] if wallet else None
+
+
+def commit_hold(user_id: str, hold_id: str, payout_id: str):
+    """
+    Turn a hold into a withdrawal of exactly the amount it reserved, so `held`
+    returns to zero whatever amount Razorpay reports. Returns False if the hold
+    was already settled.
+    """
+    amount = _hold_amount(user_id, hold_id)
+    if amount is None:
+        return False
+    now = datetime.datetime.utcnow()
+    result = db.wallet.update_one(
+        {"userId": user_id, "holds.holdId": hold_id},
+        {
+            "$inc": {"held": -amount, "withdrawn": amount},
+            "$pull": {"holds": {"holdId": hold_id}},
+            "$set": {"updatedAt": now}
+        }
+    )
+    if result.modified_count == 0:
+        return False
+    record_ledger_entry(user_id, "withdrawal", -amount, now, payoutId=payout_id, holdId=hold_id)
+    return True
+
+
+def release_hold(user_id: str, hold_id: str):
+    """Return the amount a hold reserved to the balance. Returns False if the hold was already settled."""
+    amount = _hold_amount(user_id, hold_id)
+    if amount is None:
+        return False
+    result = db.wallet.update_one(
+        {"userId": user_id, "holds.holdId": hold_id},
+        {
+            "$inc": {"held": -amount, "balance": amount},
+            "$pull": {"holds": {"holdId": hold_id}},
+            "$set": {"updatedAt": datetime.datetime.utcnow()}
+        }
+    )
+    return result.modified_count > 0
+
+
+def extend_hold(user_id: str, hold_id: str, ttl_seconds: int):
+    """
+    Keep a hold open for at least another `ttl_seconds`, claiming it for its
+    withdrawal. Returns False if the hold was already settled.
+    """
+    now = datetime.datetime.utcnow()
+    result = db.wallet.update_one(
+        {"userId": user_id, "holds.holdId": hold_id},
+        {
+            "$max": {"holds.$.expiresAt": now + datetime.timedelta(seconds=ttl_seconds)},
+            "$set": {"updatedAt": now}
+        }
+    )
+    return result.matched_count > 0
+
+
+def expired_holds(limit=100):
+    """Open holds past their expiry, as (userId, hold) pairs."""
+    now = datetime.datetime.utcnow()
+    expired = []
+    for wallet in db.wallet.find({"holds.expiresAt": {"$lt": now}}, {"userId": 1, "holds": 1}).limit(limit):
+        expired.extend((wallet["userId"], hold) for hold in wallet.get("holds", []) if hold["expiresAt"] < now)
+    return expired
+
+
+def refund_withdrawal(user_id: str, payout_id: str, amount: float):
+    """
+    Return a failed or reversed withdrawal to the user's balance, at most once per payout.
+    Returns True if the refund was applied now.
+    """
+    credit_id = f"payout:{payout_id}"
+    now = datetime.datetime.utcnow()
+    result = db.wallet.update_one(
+        {"userId": user_id, "recent_credit_ids": {"$ne": credit_id}},
+        {
+            "$inc": {"balance": amount, "withdrawn": -amount},
+            "$push": {"recent_credit_ids": {"$each": [credit_id], "$slice": -RECENT_CREDIT_IDS}},
+            "$set": {"updatedAt": now}
+        }
+    )
+    if result.matched_count == 0:
+        return False
+    record_ledger_entry(user_id, "withdrawal_reversal", amount, now, payoutId=payout_id, creditId=credit_id)
+    return True
+
+
+def _encode_ledger_cursor(bucket, remaining):
+    payload = {"v": bucket["first_at"].isoformat(), "id": str(bucket["_id"]), "r": remaining}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def _decode_ledger_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        return datetime.datetime.fromisoformat(payload["v"]), ObjectId(payload["id"]), int(payload["r"])
+    except Exception:
+        raise InvalidLedgerCursor("Invalid cursor")
+
+
+def ledger_page(user_id: str, cursor: str, limit: int):
+    """
+    Newest-first page of ledger entries and the cursor for the next page (or None).
+    The cursor remembers how many of a bucket's oldest entries are still unread,
+    so entries appended meanwhile do not shift the page.
+    """
+    query = {"userId": user_id}
+    resume = None
+    if cursor:
+        first_at, bucket_id, remaining = _decode_ledger_cursor(cursor)
+        resume = (bucket_id, remaining)
+        query["$or"] = [
+            {"first_at": {"$lt": first_at}},
+            {"first_at": first_at, "_id": {"$lte": bucket_id}}
+        ]
+    entries = []
+    buckets = db.wallet_ledger.find(query, {"entries": 1, "first_at": 1}).sort([("first_at", -1), ("_id", -1)])
+    for bucket in buckets:
+        available = bucket.get("entries", [])
+        if resume and bucket["_id"] == resume[0]:
+            available = available[:resume[1]]
+        wanted = limit - len(entries)
+        taken = available[-wanted:] if wanted < len(available) else available
+        entries.extend(reversed(taken))
+        if len(entries) >= limit:
+            remaining = len(available) - len(taken)
+            # A fully read bucket is skipped on the next page by resuming with nothing left in it.
+            return entries, _encode_ledger_cursor(bucket, remaining)
+    return entries, None
+
 
 @wallet_bp.route("/info", methods=["GET"])
 def get_wallet_info():
@@ -35,23 +321,61 @@ def get_wallet_info():
 
     Returns wallet details including:
       - userId
-      - total number of tasks done (calculated from the tasks array)
-      - tasks list (each with taskId and price)
+      - total number of tasks done
       - total_earning (sum of incomes from tasks)
       - withdrawn (total withdrawal amount)
       - remaining_balance (current balance)
+    Individual tasks and withdrawals are listed by /wallet/transactions.
     """
     try:
         user_id = request.args.get("userId", "").strip()
         if not user_id:
             return format_response(False, "userId is required", None, 400)
 
-        wallet = db.wallet.find_one({"userId": user_id}, {"_id": 0})
+        # $slice keeps a legacy tasks array out of the response while revealing that it exists.
+        wallet = db.wallet.find_one({"userId": user_id}, {"_id": 0, "recent_credit_ids": 0, "holds": 0, "tasks": {"$slice": 0}})
         if not wallet:
             return format_response(False, "Wallet not found", None, 404)
+        if "tasks" in wallet:
+            migrate_legacy_tasks(user_id)
+            wallet = db.wallet.find_one({"userId": user_id}, {"_id": 0, "recent_credit_ids": 0, "holds": 0, "tasks": 0})
 
-        wallet["no_of_tasks_done"] = len(wallet.get("tasks", []))
+        wallet["no_of_tasks_done"] = wallet.get("no_of_tasks_done", 0)
         wallet["remaining_balance"] = wallet.get("balance", 0)
         return format_response(True, "Wallet info retrieved successfully", wallet, 200)
     except Exception as e:
-        return format_response(False, f"Server error: {str(e)}", None, 500)
\ No newline at end of file
+        return format_response(False, f"Server error: {str(e)}", None, 500)
+
+
+@wallet_bp.route("/transactions", methods=["GET"])
+def get_wallet_transactions():
+    """
+    GET /wallet/transactions?userId=<user_id>&limit=20&cursor=<next_cursor>
+
+    Returns the user's wallet entries (completed tasks and withdrawals), newest
+    first, with a cursor for the next page.
+    """
+    try:
+        user_id = request.args.get("userId", "").strip()
+        if not user_id:
+            return format_response(False, "userId is required", None, 400)
+        try:
+            limit = int(request.args.get("limit", DEFAULT_TRANSACTIONS_PAGE_SIZE))
+        except ValueError:
+            return format_response(False, "limit must be an integer", None, 400)
+        if limit < 1 or limit > MAX_TRANSACTIONS_PAGE_SIZE:
+            return format_response(False, f"limit must be between 1 and {MAX_TRANSACTIONS_PAGE_SIZE}", None, 400)
+
+        if db.wallet.find_one({"userId": user_id, "tasks": {"$exists": True}}, {"_id": 1}):
+            migrate_legacy_tasks(user_id)
+        try:
+            entries, cursor_out = ledger_page(user_id, request.args.get("cursor", ""), limit)
+        except InvalidLedgerCursor:
+            return format_response(False, "Invalid cursor", None, 400)
+        return format_response(True, "Wallet transactions retrieved successfully", {
+            "userId": user_id,
+            "transactions": entries,
+            "next_cursor": cursor_out
+        }, 200)
+    except Exception as e:
+        return format_response(False, f"Server error: {str(e)}", None, 500)